@@ -1,18 +1,30 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, Response
-from datetime import datetime, timedelta, timezone
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, Response, g, has_request_context
+from datetime import date, datetime, timedelta, timezone
 from zoneinfo import ZoneInfo
 import base64
+import json
 import io
 from werkzeug.utils import secure_filename
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import current_user
 import os
 import uuid
+import threading
+import time
+import atexit
+import bisect
+import queue
+from collections import OrderedDict
 from urllib.parse import urljoin
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required
 from flask_migrate import Migrate
+from flask.cli import AppGroup
+import click
 from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+from badge_definitions import BADGE_DEFINITIONS, BADGE_METRICS, BADGE_OPERATORS, parse_criteria
+from badge_definitions import criteria_json as badge_criteria_json
 
 app = Flask(__name__)
 app.secret_key = 'your_secret_key'  # 用於 flash 訊息
@@ -222,6 +234,28 @@ def save_uploaded_file(file):
         return None
 
 
+def avatar_url_for(user):
+    """Public avatar URL for a user, preferring the DB blob route when a blob is stored."""
+    if not user:
+        return None
+    if getattr(user, 'has_avatar_blob', False):
+        try:
+            return url_for('user_avatar', user_id=user.id)
+        except Exception:
+            return user.avatar
+    return user.avatar
+
+
+def post_image_url(p):
+    """Public image URL for a post, preferring the DB blob route when a blob is stored."""
+    if getattr(p, 'has_image_blob', False):
+        try:
+            return url_for('post_image', post_id=p.id)
+        except Exception:
+            return p.image
+    return p.image
+
+
 def to_local_str(dt):
     """Convert a stored UTC datetime (naive or tz-aware) to Asia/Taipei formatted string."""
     if not dt:
@@ -240,6 +274,20 @@ def to_local_str(dt):
             return ''
 
 
+LOCAL_TZ_NAME = 'Asia/Taipei'
+
+
+def local_date_of(dt):
+    """Asia/Taipei calendar date of a stored (naive UTC) datetime."""
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(ZoneInfo(LOCAL_TZ_NAME)).date()
+
+
+def local_today():
+    return datetime.now(ZoneInfo(LOCAL_TZ_NAME)).date()
+
+
 # 登入管理
 login_manager = LoginManager()
 login_manager.init_app(app)
@@ -257,8 +305,10 @@ class User(UserMixin, db.Model):
     display_name = db.Column(db.String(120), nullable=True)
     avatar = db.Column(db.String(300), nullable=True)
     # optionally map avatar_blob/avatar_mime only if DB has those columns
+    # the bytes are deferred so listings don't drag them along; has_avatar_blob is the cheap check
     if USER_TABLE in EXISTING_COLUMNS and 'avatar_blob' in EXISTING_COLUMNS.get(USER_TABLE, set()):
-        avatar_blob = db.Column(db.LargeBinary, nullable=True)
+        avatar_blob = db.deferred(db.Column(db.LargeBinary, nullable=True))
+        has_avatar_blob = db.column_property(avatar_blob.columns[0].isnot(None))
     if USER_TABLE in EXISTING_COLUMNS and 'avatar_mime' in EXISTING_COLUMNS.get(USER_TABLE, set()):
         avatar_mime = db.Column(db.String(100), nullable=True)
     notify = db.Column(db.Boolean, default=True)
@@ -274,13 +324,36 @@ class Post(db.Model):
     image = db.Column(db.String(300), nullable=True)
     # optionally map image_blob/image_mime only if DB has those columns
     if 'post' in EXISTING_COLUMNS and 'image_blob' in EXISTING_COLUMNS.get('post', set()):
-        image_blob = db.Column(db.LargeBinary, nullable=True)
+        image_blob = db.deferred(db.Column(db.LargeBinary, nullable=True))
+        has_image_blob = db.column_property(image_blob.columns[0].isnot(None))
     if 'post' in EXISTING_COLUMNS and 'image_mime' in EXISTING_COLUMNS.get('post', set()):
         image_mime = db.Column(db.String(100), nullable=True)
     shared_from_id = db.Column(db.Integer, db.ForeignKey('post.id'), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Asia/Taipei calendar date of created_at, stored so per-day queries are plain index range scans
+    local_date = db.Column(db.Date, nullable=True)
     likes = db.Column(db.Integer, default=0)
+    # kept in step by add_comment / delete_account; `flask counters reconcile` recomputes it
+    comment_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # bumped by every write that changes what a feed page shows for this post (likes, comments,
+    # edits) in the statement that makes the change; cached pages compare it (see get_feed_page)
+    cache_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     user = db.relationship('User', backref=db.backref('posts', lazy=True))
+    __table_args__ = (
+        # keyset feed order and per-author lookups (friends-only semi-join)
+        db.Index('ix_post_created_at_id', 'created_at', 'id'),
+        db.Index('ix_post_user_id_created_at', 'user_id', 'created_at'),
+        db.Index('ix_post_user_id_local_date', 'user_id', 'local_date'),
+    )
+
+
+@db.event.listens_for(Post, 'before_insert')
+@db.event.listens_for(Post, 'before_update')
+def _stamp_post_local_date(mapper, connection, target):
+    # keep local_date in step with created_at for every write path (checkin, share, edit, scripts)
+    if target.created_at is None:
+        target.created_at = datetime.utcnow()
+    target.local_date = local_date_of(target.created_at)
 
 class Comment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -291,6 +364,10 @@ class Comment(db.Model):
     text = db.Column(db.Text, nullable=False)
     time = db.Column(db.DateTime, default=datetime.utcnow)
     post = db.relationship('Post', backref=db.backref('comments', lazy=True))
+    __table_args__ = (
+        # latest-K window per post in the feed and keyset pages of older comments
+        db.Index('ix_comment_post_id_time', 'post_id', 'time'),
+    )
 
 # 定義 Leaderboard 和 Badge 資料模型
 class Leaderboard(db.Model):
@@ -325,6 +402,11 @@ class Friend(db.Model):
     owner_id = db.Column(db.Integer, db.ForeignKey(f"{USER_TABLE}.id"), nullable=False)
     friend_name = db.Column(db.String(80), nullable=False)
     owner = db.relationship('User', backref=db.backref('friends', lazy=True))
+    __table_args__ = (
+        db.Index('ix_friend_owner_id_friend_name', 'owner_id', 'friend_name'),
+        # reverse lookup: who has this user as a friend (timeline fan-out)
+        db.Index('ix_friend_friend_name', 'friend_name'),
+    )
 
 class PendingInvite(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -351,6 +433,21 @@ class Notification(db.Model):
     data = db.Column(db.Text, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     read = db.Column(db.Boolean, default=False)
+    # grouped notifications: one row per (recipient, verb, post, time window); see notification_group_key()
+    group_key = db.Column(db.String(120), nullable=True)
+    actor_count = db.Column(db.Integer, nullable=False, default=1)
+    recent_actors = db.Column(db.Text, nullable=True)  # JSON list of user ids, most recent first
+    __table_args__ = (
+        db.Index('uix_notification_user_group', 'user_id', 'group_key', unique=True),
+        db.Index('ix_notification_user_id_created_at', 'user_id', 'created_at'),
+    )
+
+
+# distinct actors folded into a grouped notification; recent_actors only keeps the last few
+class NotificationActor(db.Model):
+    __tablename__ = 'notification_actor'
+    notification_id = db.Column(db.Integer, db.ForeignKey('notification.id'), primary_key=True)
+    actor_id = db.Column(db.Integer, db.ForeignKey(f"{USER_TABLE}.id"), primary_key=True)
 
 
 # association: which user earned which badge
@@ -362,21 +459,213 @@ class UserBadge(db.Model):
     pinned = db.Column(db.Boolean, default=False)
     user = db.relationship('User', backref=db.backref('user_badges', lazy=True))
     badge = db.relationship('Badge', backref=db.backref('earned_by', lazy=True))
+    __table_args__ = (
+        # one row per earned badge; awarding is INSERT ... ON CONFLICT DO NOTHING on this
+        db.Index('uix_user_badge_user_badge', 'user_id', 'badge_id', unique=True),
+    )
+
+
+# Fan-out-on-write timelines: one row per (recipient, post) the recipient may see.
+# Public posts are written once to the shared timeline (owner_id = PUBLIC_TIMELINE_ID);
+# friends-only posts go to the author and to every user who has the author as a friend.
+PUBLIC_TIMELINE_ID = 0
+
+
+class TimelineEntry(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    owner_id = db.Column(db.Integer, nullable=False)  # recipient user id, or PUBLIC_TIMELINE_ID
+    post_id = db.Column(db.Integer, db.ForeignKey('post.id'), nullable=False)
+    author_id = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)  # copy of post.created_at (feed order key)
+    __table_args__ = (
+        db.UniqueConstraint('owner_id', 'post_id', name='uix_timeline_owner_post'),
+        db.Index('ix_timeline_owner_created_post', 'owner_id', 'created_at', 'post_id'),
+        db.Index('ix_timeline_post_id', 'post_id'),
+    )
 
 
-def create_notification(recipient_id, actor_id=None, verb='notify', post_id=None, comment_id=None, data=None):
+# Shared version counters used to invalidate per-process caches across gunicorn workers.
+class CacheVersion(db.Model):
+    name = db.Column(db.String(80), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+
+# Per-user, per-local-day (Asia/Taipei) activity rollup, maintained by the post write paths.
+# Shares are not activity, so only original check-ins are counted.
+class UserDailyMinutes(db.Model):
+    __tablename__ = 'user_daily_minutes'
+    user_id = db.Column(db.Integer, db.ForeignKey(f"{USER_TABLE}.id"), primary_key=True)
+    local_date = db.Column(db.Date, primary_key=True)
+    minutes = db.Column(db.Integer, nullable=False, default=0)
+    post_count = db.Column(db.Integer, nullable=False, default=0)
+    __table_args__ = (
+        # leaderboard windows scan a date range across all users
+        db.Index('ix_user_daily_minutes_local_date', 'local_date'),
+    )
+
+
+# One row per user with running totals, updated in the same transaction as the write that moves
+# them (see bump_counters); `flask counters reconcile` recomputes them from the source tables.
+class UserCounters(db.Model):
+    __tablename__ = 'user_counters'
+    user_id = db.Column(db.Integer, db.ForeignKey(f"{USER_TABLE}.id"), primary_key=True)
+    total_minutes = db.Column(db.Integer, nullable=False, default=0)
+    post_count = db.Column(db.Integer, nullable=False, default=0)
+    likes_received = db.Column(db.Integer, nullable=False, default=0)
+    comments_received = db.Column(db.Integer, nullable=False, default=0)
+    friend_count = db.Column(db.Integer, nullable=False, default=0)
+    # server default so rows written without it (older migrations' backfills) still insert
+    unread_notifications = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # load_user joins this in, so pages can show the unread badge without another query
+    user = db.relationship('User', backref=db.backref('counters', uselist=False, lazy=True))
+
+
+# Durable side effects (notifications, badge checks) written in the same transaction as the
+# request's primary write and handled by the outbox worker; see enqueue_event().
+class OutboxEvent(db.Model):
+    __tablename__ = 'outbox_event'
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(40), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(10), nullable=False, default='pending')  # pending, done, dead
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    available_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    processed_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    __table_args__ = (
+        db.Index('ix_outbox_event_status_available_at', 'status', 'available_at'),
+    )
+
+
+# Short-lived fan-out log for the /events stream: written in the transaction of the change it
+# announces, read by every app process's LiveEventHub, pruned after LIVE_EVENT_TTL seconds.
+class LiveEvent(db.Model):
+    __tablename__ = 'live_event'
+    id = db.Column(db.Integer, primary_key=True)
+    topic = db.Column(db.String(40), nullable=False)  # user:<id> or post:<id>
+    kind = db.Column(db.String(20), nullable=False)
+    data = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+
+# Frozen weekly standings (Monday-start Asia/Taipei weeks). A LeaderboardWeek row marks a week as
+# frozen; its LeaderboardSnapshot rows are written once in the same transaction and never change.
+class LeaderboardWeek(db.Model):
+    __tablename__ = 'leaderboard_week'
+    week_start = db.Column(db.Date, primary_key=True)
+    frozen_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class LeaderboardSnapshot(db.Model):
+    __tablename__ = 'leaderboard_snapshot'
+    id = db.Column(db.Integer, primary_key=True)
+    week_start = db.Column(db.Date, db.ForeignKey('leaderboard_week.week_start'), nullable=False)
+    rank = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey(f"{USER_TABLE}.id"), nullable=False)
+    points = db.Column(db.Integer, nullable=False)
+    __table_args__ = (
+        db.UniqueConstraint('week_start', 'user_id', name='uix_leaderboard_snapshot_week_user'),
+        db.Index('ix_leaderboard_snapshot_week_rank', 'week_start', 'rank'),
+    )
+
+
+# --- Notifications ---
+# Likes, comments, shares and mentions on the same post are folded into one row per recipient and
+# NOTIFY_GROUP_WINDOW_HOURS window ("Alice and 12 others liked your post"). Users who turned
+# notifications off (User.notify) get no rows at all.
+NOTIFY_GROUPED_VERBS = ('like', 'comment', 'share', 'mention')
+NOTIFY_GROUP_WINDOW = timedelta(hours=float(os.environ.get('NOTIFY_GROUP_WINDOW_HOURS', '24')))
+NOTIFY_RECENT_ACTORS = 3
+
+
+def notification_group_key(verb, post_id, at=None):
+    """Key of the aggregate row an event at `at` folds into, or None for ungrouped notifications."""
+    if verb not in NOTIFY_GROUPED_VERBS or not post_id:
+        return None
+    bucket = int(((at or datetime.utcnow()) - datetime(1970, 1, 1)) / NOTIFY_GROUP_WINDOW)
+    return f'{verb}:{post_id}:{bucket}'
+
+
+def wants_notifications(user_id):
+    return db.session.query(User.id).filter(User.id == user_id, User.notify.isnot(False)).first() is not None
+
+
+def create_notification(recipient_id, actor_id=None, verb='notify', post_id=None, comment_id=None, data=None, commit=True, group_key=None):
+    """Add a notification, or fold it into the recipient's row for group_key: one upsert that also
+    locks the row, then the actor count and recent actors are updated in place. An actor raises
+    the count only the first time it joins the group (see NotificationActor)."""
     try:
-        n = Notification(user_id=recipient_id, actor_id=actor_id, verb=verb, post_id=post_id, comment_id=comment_id, data=data)
-        db.session.add(n)
-        db.session.commit()
+        if group_key is None:
+            db.session.add(Notification(user_id=recipient_id, actor_id=actor_id, verb=verb, post_id=post_id, comment_id=comment_id, data=data))
+            moved = bump_counters(recipient_id, unread_notifications=1)
+        else:
+            now = datetime.utcnow()
+            # a fresh row is inserted with recent_actors NULL, which tells it apart from an update below
+            stmt = dialect_insert(Notification).values(
+                user_id=recipient_id, actor_id=actor_id, verb=verb, post_id=post_id, comment_id=comment_id, data=data,
+                created_at=now, read=False, group_key=group_key, actor_count=1, recent_actors=None)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['user_id', 'group_key'],
+                set_={'actor_id': actor_id, 'comment_id': comment_id, 'data': data, 'created_at': now},
+            ).returning(Notification.id, Notification.actor_count, Notification.recent_actors, Notification.read)
+            nid, count, raw, was_read = db.session.execute(stmt).one()
+            recent = json.loads(raw) if raw else []
+            new_actor = True
+            if actor_id is not None:
+                joined = dialect_insert(NotificationActor).values(notification_id=nid, actor_id=actor_id)
+                new_actor = bool(db.session.execute(joined.on_conflict_do_nothing(index_elements=['notification_id', 'actor_id'])).rowcount)
+            # a new actor raises the count; a repeat actor only moves to the front
+            if raw and new_actor:
+                count += 1
+            recent = ([actor_id] + [a for a in recent if a != actor_id])[:NOTIFY_RECENT_ACTORS]
+            db.session.execute(db.update(Notification).where(Notification.id == nid).values(
+                actor_count=count, recent_actors=json.dumps(recent), read=False), execution_options={'synchronize_session': False})
+            moved = bump_counters(recipient_id, unread_notifications=1) if not raw or was_read else {}
+        publish_live(f'user:{recipient_id}', 'notification', verb=verb, post_id=post_id, actor_id=actor_id)
+        live_unread_event(recipient_id, moved)
+        if commit:
+            db.session.commit()
         return True
     except Exception:
+        if not commit:
+            # outbox handlers: the worker's savepoint rolls back and retries
+            raise
         db.session.rollback()
         return False
 
+
+def remove_notification_actor(recipient_id, actor_id, group_key):
+    """Undo one actor's contribution to a grouped notification (e.g. an unlike): decrement the
+    count, or delete the row when nobody is left. Actors that never joined the group (their
+    notify was skipped) change nothing. The caller commits."""
+    n = Notification.query.filter_by(user_id=recipient_id, group_key=group_key).with_for_update().first()
+    if n is None:
+        return
+    left = db.session.execute(db.delete(NotificationActor).where(
+        NotificationActor.notification_id == n.id, NotificationActor.actor_id == actor_id)).rowcount
+    if not left:
+        return
+    if (n.actor_count or 1) <= 1:
+        if not n.read:
+            live_unread_event(recipient_id, bump_counters(recipient_id, unread_notifications=-1))
+        NotificationActor.query.filter_by(notification_id=n.id).delete()
+        db.session.delete(n)
+        return
+    n.actor_count -= 1
+    recent = [a for a in json.loads(n.recent_actors or '[]') if a != actor_id]
+    if n.verb == 'like' and len(recent) < min(n.actor_count, NOTIFY_RECENT_ACTORS):
+        # refill from the post's remaining likers
+        recent = [uid for (uid,) in db.session.query(Like.user_id).filter(Like.post_id == n.post_id, Like.user_id != recipient_id)
+                  .order_by(Like.created_at.desc()).limit(NOTIFY_RECENT_ACTORS).all()]
+    n.recent_actors = json.dumps(recent)
+    if n.actor_id == actor_id:
+        n.actor_id = recent[0] if recent else None
+
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return db.session.get(User, int(user_id), options=[db.joinedload(User.counters)])
  
 # Admin helper: simple username-based admin check (configure ADMIN_USERNAMES env var comma-separated)
 def is_admin_user():
@@ -388,45 +677,233 @@ def is_admin_user():
 
 
 
+# --- Like counter write-behind (LIKE_WRITE_BEHIND=1) ---
+# For viral posts every like would update the same post row (and the author's counters row). In
+# write-behind mode like_post still writes the Like row, but the post.likes / likes_received deltas
+# collect here per process and are written in one batch every LIKE_FLUSH_INTERVAL seconds or
+# LIKE_FLUSH_EVENTS likes, plus once more at exit. Reads add the pending deltas (pending_likes).
+LIKE_WRITE_BEHIND = os.environ.get('LIKE_WRITE_BEHIND', '0') == '1'
+LIKE_FLUSH_INTERVAL = float(os.environ.get('LIKE_FLUSH_INTERVAL', '0.25'))
+LIKE_FLUSH_EVENTS = int(os.environ.get('LIKE_FLUSH_EVENTS', '200'))
+
+
+class LikeCounterBuffer:
+    """Unflushed like-count deltas of this process, keyed by post id."""
+
+    def __init__(self, interval, max_events):
+        self.interval = interval
+        self.max_events = max_events
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = {}  # post_id -> [delta, owner_id]
+        self._inflight = {}  # post_id -> delta being written by flush()
+        self._events = 0
+        self._wake = threading.Event()
+        self._thread = None
+
+    def add(self, post_id, owner_id, delta):
+        with self._lock:
+            entry = self._pending.setdefault(post_id, [0, owner_id])
+            entry[0] += delta
+            self._events += 1
+            full = self._events >= self.max_events
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='like-flush', daemon=True)
+                self._thread.start()
+        if full:
+            self._wake.set()
+
+    def pending(self, post_ids):
+        """{post_id: delta} not yet committed to post.likes, for the given posts."""
+        with self._lock:
+            out = {}
+            for pid in post_ids:
+                d = self._pending.get(pid, (0,))[0] + self._inflight.get(pid, 0)
+                if d:
+                    out[pid] = d
+            return out
+
+    def flush(self):
+        """Write every pending delta: one executemany UPDATE of post.likes (which also moves each
+        post's cache_version) and one likes_received bump per author (which also queues their badge
+        check). Returns the number of posts written; on failure the deltas go back to pending."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending, self._events = self._pending, {}, 0
+                self._inflight = {pid: d for pid, (d, _) in batch.items()}
+            batch = {pid: v for pid, v in batch.items() if v[0]}
+            try:
+                if batch:
+                    db.session.execute(text('UPDATE post SET likes = COALESCE(likes, 0) + :d, cache_version = cache_version + 1 WHERE id = :pid'),
+                                       [{'pid': pid, 'd': d} for pid, (d, _) in batch.items()])
+                    by_owner = {}
+                    for d, owner_id in batch.values():
+                        by_owner[owner_id] = by_owner.get(owner_id, 0) + d
+                    for owner_id, d in by_owner.items():
+                        moved = bump_counters(owner_id, likes_received=d)
+                        if owner_id and d > 0:
+                            enqueue_event('badge', user_id=owner_id, event='like_received', changes=moved)
+                    db.session.commit()
+            except Exception:
+                db.session.rollback()
+                with self._lock:
+                    for pid, (d, owner_id) in batch.items():
+                        self._pending.setdefault(pid, [0, owner_id])[0] += d
+                raise
+            finally:
+                with self._lock:
+                    self._inflight = {}
+            return len(batch)
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                with app.app_context():
+                    self.flush()
+            except Exception:
+                app.logger.exception('like counter flush failed')
+
+
+like_buffer = LikeCounterBuffer(LIKE_FLUSH_INTERVAL, LIKE_FLUSH_EVENTS)
+
+
+@atexit.register
+def _flush_likes_at_exit():
+    if not LIKE_WRITE_BEHIND:
+        return
+    try:
+        with app.app_context():
+            like_buffer.flush()
+    except Exception:
+        app.logger.exception('final like counter flush failed')
+
+
+def merge_pending_likes(posts):
+    """Feed post dicts with this process's unflushed like deltas added (copies only where needed)."""
+    if not LIKE_WRITE_BEHIND or not posts:
+        return posts
+    pending = like_buffer.pending([p['id'] for p in posts])
+    if not pending:
+        return posts
+    return [dict(p, likes=(p['likes'] or 0) + pending[p['id']]) if p['id'] in pending else p for p in posts]
+
+
+def after_commit(fn):
+    """Run fn once the request's transaction has committed (see run_after_commit), for in-memory
+    state that must not move if the write is rolled back, e.g. like_buffer."""
+    g.setdefault('after_commit', []).append(fn)
+
+
+def run_after_commit():
+    for fn in g.pop('after_commit', []):
+        fn()
+
+
+def apply_like(uid, post_id, want=None):
+    """Like (want=True), unlike (want=False) or toggle (want=None) inside the current transaction;
+    the caller commits, or rolls back on a non-200 status. Returns (status, body).
+
+    DELETE ... RETURNING removes an existing like, otherwise INSERT ... ON CONFLICT DO NOTHING adds
+    one; post.likes then moves with a single `likes = likes + :d` UPDATE, so concurrent toggles never
+    lose counts and the body carries the database's count. With LIKE_WRITE_BEHIND the counter deltas
+    go to like_buffer instead and the body adds the pending ones. Raises IntegrityError for a post
+    that does not exist (foreign key)."""
+    removed = None
+    if want is not True:
+        removed = db.session.execute(db.delete(Like).where(Like.user_id == uid, Like.post_id == post_id).returning(Like.created_at),
+                                     execution_options={'synchronize_session': False}).first()
+    if removed is not None:
+        delta, liked, liked_at = -1, False, removed.created_at
+    elif want is False:
+        delta, liked, liked_at = 0, False, None
+    else:
+        liked_at = datetime.utcnow()
+        stmt = dialect_insert(Like).values(user_id=uid, post_id=post_id, created_at=liked_at)
+        inserted = db.session.execute(stmt.on_conflict_do_nothing(index_elements=['user_id', 'post_id']).returning(Like.id)).first()
+        # already liked (or a concurrent request of the same user got there first): count unchanged
+        delta, liked = (1 if inserted is not None else 0), True
+    buffered = bool(delta) and LIKE_WRITE_BEHIND
+    if delta and not buffered:
+        row = db.session.execute(db.update(Post).where(Post.id == post_id).values(
+            likes=db.func.coalesce(Post.likes, 0) + delta, cache_version=Post.cache_version + 1)
+            .returning(Post.likes, Post.user_id), execution_options={'synchronize_session': False}).first()
+    else:
+        row = db.session.query(Post.likes, Post.user_id).filter(Post.id == post_id).first()
+    if row is None:
+        return 404, {'ok': False}
+    likes, owner_id = int(row.likes or 0), row.user_id
+    if LIKE_WRITE_BEHIND:
+        # stored count plus this process's unflushed deltas, including this one (added after commit)
+        likes += like_buffer.pending([post_id]).get(post_id, 0) + (delta if buffered else 0)
+    if delta:
+        # write-behind: like_buffer's flush bumps likes_received and queues the badge check
+        moved = {} if buffered else bump_counters(owner_id, likes_received=delta)
+        publish_live(f'post:{post_id}', 'likes', post_id=post_id, likes=likes)
+        # notify the post owner and check their like-count badges (outbox worker)
+        if owner_id and owner_id != uid:
+            group_key = notification_group_key('like', post_id, liked_at)
+            if delta > 0:
+                enqueue_event('notify', recipient_id=owner_id, actor_id=uid, verb='like', post_id=post_id, group_key=group_key)
+                if not buffered:
+                    enqueue_event('badge', user_id=owner_id, event='like_received', changes=moved)
+            else:
+                enqueue_event('unnotify', recipient_id=owner_id, actor_id=uid, group_key=group_key, post_id=post_id)
+        if buffered:
+            # other viewers' cached pages add the pending delta when served and the flush moves the
+            # post's cache_version; only this viewer's pages (the liked flag) are dropped now
+            invalidate_feed(uid)
+            after_commit(lambda: like_buffer.add(post_id, owner_id, delta))
+    return 200, {'ok': True, 'likes': likes, 'liked': liked}
+
+
 @app.route('/like', methods=['POST'])
 @login_required
 def like_post():
-    post_id = int(request.form.get('post_id', 0))
-    p = Post.query.get(post_id)
-    if not p:
+    """Toggle the viewer's like on a post (see apply_like)."""
+    post_id = request.form.get('post_id', type=int) or 0
+    try:
+        status, body = apply_like(current_user.id, post_id)
+        if status != 200:
+            db.session.rollback()
+            return jsonify(body), status
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
         return jsonify({'ok': False}), 404
+    except Exception:
+        db.session.rollback()
+        return jsonify({'ok': False}), 500
+    run_after_commit()
+    return jsonify(body)
 
-    existing = Like.query.filter_by(user_id=current_user.id, post_id=post_id).first()
-    if existing:
-        # unlike
-        try:
-            db.session.delete(existing)
-            p.likes = max((p.likes or 1) - 1, 0)
-            db.session.commit()
-            return jsonify({'ok': True, 'likes': p.likes, 'liked': False})
-        except Exception:
-            db.session.rollback()
-            return jsonify({'ok': False}), 500
-    else:
-        # add like
-        try:
-            lk = Like(user_id=current_user.id, post_id=post_id)
-            db.session.add(lk)
-            p.likes = (p.likes or 0) + 1
-            db.session.commit()
-            # create notification for post owner
-            if p.user_id and p.user_id != current_user.id:
-                create_notification(recipient_id=p.user_id, actor_id=current_user.id, verb='like', post_id=p.id)
-            # award like-count-based badges for post owner
-            try:
-                if p.user_id and p.user_id != current_user.id:
-                    run_award_checks_on_user(p.user_id)
-            except Exception:
-                pass
-            return jsonify({'ok': True, 'likes': p.likes, 'liked': True})
-        except Exception:
-            db.session.rollback()
-            return jsonify({'ok': False}), 500
+
+def add_comment(post_id, text, commenter_id, commenter_name, commenter_avatar=None):
+    """Add a comment inside the current transaction (the caller commits). Returns (status, body)."""
+    text = (text or '').strip()
+    if not text:
+        return 400, {'ok': False, 'error': 'empty'}
+    p = Post.query.get(post_id)
+    if not p:
+        return 404, {'ok': False}
+    comment = Comment(post_id=p.id, user=commenter_name, user_id=commenter_id, avatar=commenter_avatar, text=text)
+    db.session.add(comment)
+    moved = bump_counters(p.user_id, comments_received=1)
+    comment_count = db.session.execute(db.update(Post).where(Post.id == p.id).values(
+        comment_count=db.func.coalesce(Post.comment_count, 0) + 1, cache_version=Post.cache_version + 1)
+        .returning(Post.comment_count), execution_options={'synchronize_session': False}).scalar()
+    db.session.flush()
+    # notify the post owner, check their comment badges and notify @mentions (outbox worker)
+    if p.user_id and commenter_id != p.user_id:
+        enqueue_event('notify', recipient_id=p.user_id, actor_id=commenter_id, verb='comment', post_id=p.id, comment_id=comment.id, data=text,
+                      group_key=notification_group_key('comment', p.id) if commenter_id else None)
+        enqueue_event('badge', user_id=p.user_id, event='comment_received', changes=moved)
+    if '@' in text:
+        enqueue_event('mentions', message=text, actor_id=commenter_id, post_id=p.id, comment_id=comment.id)
+    comment_json = {'user': comment.user, 'avatar': comment.avatar, 'text': comment.text, 'time': to_local_str(comment.time)}
+    publish_live(f'post:{p.id}', 'comment', post_id=p.id, actor_id=commenter_id, comment=comment_json, comment_count=comment_count)
+    return 200, {'ok': True, 'comment': comment_json, 'comment_count': comment_count}
 
 
 @app.route('/comment', methods=['POST'])
@@ -442,56 +919,244 @@ def comment_post():
         commenter_id = None
         commenter_avatar = None
 
-    text = request.form.get('text', '').strip()
-    if not text:
-        return jsonify({'ok': False, 'error': 'empty'}), 400
-    p = Post.query.get(post_id)
-    if p:
-        comment = Comment(post_id=p.id, user=commenter_name, user_id=commenter_id, avatar=commenter_avatar, text=text)
-        db.session.add(comment)
-        db.session.commit()
-        # notify post owner if different
-        try:
-            if p.user_id and commenter_id != p.user_id:
-                create_notification(recipient_id=p.user_id, actor_id=commenter_id, verb='comment', post_id=p.id, comment_id=comment.id, data=text)
-        except Exception:
-            pass
-        # award comment-count-based badges for post owner
-        try:
-            if p.user_id and p.user_id != commenter_id:
-                run_award_checks_on_user(p.user_id)
-        except Exception:
-            pass
-        # notify mentioned users in the comment text
-        try:
-            mentions = re.findall(r'@([A-Za-z0-9_\-]+)', text)
-            for uname in set(mentions):
-                u = User.query.filter_by(username=uname).first()
-                if u and u.id != commenter_id:
-                    create_notification(recipient_id=u.id, actor_id=commenter_id, verb='mention', post_id=p.id, comment_id=comment.id, data=text)
-        except Exception:
-            pass
-        return jsonify({'ok': True, 'comment': {'user': comment.user, 'avatar': comment.avatar, 'text': comment.text, 'time': to_local_str(comment.time)}})
-    return jsonify({'ok': False}), 404
+    status, body = add_comment(post_id, request.form.get('text', ''), commenter_id, commenter_name, commenter_avatar)
+    if status != 200:
+        return jsonify(body), status
+    db.session.commit()
+    return jsonify(body)
 
 from sqlalchemy import case, and_
 from sqlalchemy import or_
-from sqlalchemy import text
 import re
 
 
-# --- Badge awarding helpers ---
-BADGE_DEFINITIONS = {
-    'streak_3': {'title': '3 Day Streak', 'desc': 'Complete 3 consecutive check-ins', 'slug': 'streak_3', 'image_files': ['3 day.png']},
-    'streak_7': {'title': '7 Day Streak', 'desc': 'Complete 7 consecutive check-ins', 'slug': 'streak_7', 'image_files': ['7 day.png']},
-    'hours_50': {'title': '50 Hours', 'desc': 'Accumulate 50 hours of activity', 'slug': 'hours_50', 'image_files': ['50 hour.png']},
-    'hours_100': {'title': '100 Hours', 'desc': 'Accumulate 100 hours of activity', 'slug': 'hours_100', 'image_files': ['100hour.png']},
-    'likes_10': {'title': '10 Likes', 'desc': 'Receive 10 likes on your posts', 'slug': 'likes_10', 'image_files': ['10good.png']},
-    'friends_3': {'title': '3 Friends', 'desc': 'Have 3 friends', 'slug': 'friends_3', 'image_files': ['3friend.png']},
-    'friends_10': {'title': '10 Friends', 'desc': 'Have 10 friends', 'slug': 'friends_10', 'image_files': ['10friend.png']},
-}
+# --- Daily activity rollup (user_daily_minutes) ---
+def record_daily_minutes(user_id, local_date, minutes, posts):
+    """Add minutes/post-count deltas to a user's day bucket in the current transaction (caller commits)."""
+    if not user_id or local_date is None or (not minutes and not posts):
+        return
+    stmt = dialect_insert(UserDailyMinutes).values(user_id=user_id, local_date=local_date, minutes=minutes, post_count=posts)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['user_id', 'local_date'],
+        set_={'minutes': UserDailyMinutes.minutes + minutes, 'post_count': UserDailyMinutes.post_count + posts},
+    )
+    db.session.execute(stmt)
+    if posts < 0:
+        # a day with no posts left has no bucket
+        UserDailyMinutes.query.filter(UserDailyMinutes.user_id == user_id, UserDailyMinutes.local_date == local_date,
+                                      UserDailyMinutes.post_count <= 0).delete(synchronize_session=False)
+
+
+def record_post_activity(p, sign=1):
+    """Apply (sign=1) or retract (sign=-1) a post's contribution to the daily rollup."""
+    if p.shared_from_id or not p.created_at:
+        return
+    record_daily_minutes(p.user_id, p.local_date or local_date_of(p.created_at), sign * int(p.minutes or 0), sign)
+
+
+def minutes_since_query(start_date):
+    """(user_id, minutes) rows summed from the daily rollup for local dates >= start_date.
+    start_date=None means all time and reads the per-user running totals in user_counters."""
+    if start_date is None:
+        return db.session.query(UserCounters.user_id, UserCounters.total_minutes.label('minutes')).filter(UserCounters.total_minutes > 0)
+    q = db.session.query(UserDailyMinutes.user_id, db.func.sum(UserDailyMinutes.minutes).label('minutes'))
+    q = q.filter(UserDailyMinutes.local_date >= start_date)
+    return q.group_by(UserDailyMinutes.user_id)
+
+
+def _rollup_source_query():
+    """Daily buckets recomputed from post: (user_id, local_date, minutes, post_count)."""
+    return db.select(Post.user_id, Post.local_date, db.func.coalesce(db.func.sum(Post.minutes), 0), db.func.count(Post.id)).where(
+        Post.shared_from_id.is_(None), Post.local_date.isnot(None)
+    ).group_by(Post.user_id, Post.local_date)
+
+
+def rebuild_daily_rollup():
+    """Recompute user_daily_minutes from post in one set-based pass. Returns the number of buckets."""
+    UserDailyMinutes.query.delete(synchronize_session=False)
+    db.session.execute(db.insert(UserDailyMinutes).from_select(['user_id', 'local_date', 'minutes', 'post_count'], _rollup_source_query()))
+    total = db.session.query(db.func.count()).select_from(UserDailyMinutes).scalar() or 0
+    db.session.commit()
+    return total
+
+
+def check_daily_rollup():
+    """Compare the rollup against post. Returns a list of (user_id, local_date, expected, actual) mismatches,
+    where expected/actual are (minutes, post_count) tuples or None for a missing bucket."""
+    expected = {(r[0], str(r[1])): (int(r[2]), int(r[3])) for r in db.session.execute(_rollup_source_query()).all()}
+    actual = {(r.user_id, str(r.local_date)): (int(r.minutes), int(r.post_count)) for r in UserDailyMinutes.query.all()}
+    drift = []
+    for key in sorted(set(expected) | set(actual), key=lambda k: (k[0], k[1])):
+        if expected.get(key) != actual.get(key):
+            drift.append((key[0], key[1], expected.get(key), actual.get(key)))
+    return drift
+
+
+rollup_cli = AppGroup('rollup', help='Daily activity rollup (user_daily_minutes).')
+
+
+@rollup_cli.command('rebuild')
+def rollup_rebuild_command():
+    """Recompute the rollup from post."""
+    click.echo(f'daily buckets written: {rebuild_daily_rollup()}')
+
+
+@rollup_cli.command('check')
+def rollup_check_command():
+    """Report buckets that disagree with post (exit code 1 on drift)."""
+    drift = check_daily_rollup()
+    for user_id, day, expected, actual in drift:
+        click.echo(f'user={user_id} date={day} expected={expected} actual={actual}')
+    click.echo(f'{len(drift)} mismatched buckets')
+    if drift:
+        raise SystemExit(1)
+
+
+app.cli.add_command(rollup_cli)
+
 
+# --- Per-user counters ---
+COUNTER_FIELDS = ('total_minutes', 'post_count', 'likes_received', 'comments_received', 'friend_count', 'unread_notifications')
 
+
+def bump_counters(user_id, **deltas):
+    """Apply `col = col + delta` to one user's counters inside the caller's transaction and return
+    {counter: (old, new)} for the bumped ones. A user with no counters row yet gets one computed from
+    the tables (which already include this write), and {} is returned."""
+    deltas = {k: int(v) for k, v in deltas.items() if v}
+    if not user_id or not deltas:
+        return {}
+    for name in deltas:
+        if name not in COUNTER_FIELDS:
+            raise ValueError(f'unknown counter {name}')
+    values = {getattr(UserCounters, k): getattr(UserCounters, k) + d for k, d in deltas.items()}
+    stmt = db.update(UserCounters).where(UserCounters.user_id == user_id).values(values).returning(*[getattr(UserCounters, k) for k in deltas])
+    row = db.session.execute(stmt).first()
+    if row is None:
+        stmt = dialect_insert(UserCounters).from_select(['user_id'] + list(COUNTER_FIELDS), _counters_source_query([user_id]))
+        db.session.execute(stmt.on_conflict_do_nothing(index_elements=['user_id']))
+        return {}
+    return {k: (int(v) - deltas[k], int(v)) for k, v in zip(deltas, row)}
+
+
+def bump_counters_many(name, deltas_by_user):
+    """Apply one counter delta per user with a single executemany UPDATE (users without a row are
+    left for `flask counters reconcile`)."""
+    params = [{'uid': uid, 'd': int(d)} for uid, d in deltas_by_user.items() if uid and d]
+    if not params:
+        return
+    if name not in COUNTER_FIELDS:
+        raise ValueError(f'unknown counter {name}')
+    db.session.execute(text(f'UPDATE user_counters SET {name} = {name} + :d WHERE user_id = :uid'), params)
+
+
+def _counters_source_query(user_ids=None):
+    """(user_id, total_minutes, post_count, likes_received, comments_received, friend_count,
+    unread_notifications) computed from post/like/comment/friend/notification, one row per user."""
+    posts = db.select(
+        Post.user_id.label('user_id'),
+        db.func.coalesce(db.func.sum(db.case((Post.shared_from_id.is_(None), Post.minutes), else_=0)), 0).label('minutes'),
+        db.func.count(Post.id).label('n'),
+    ).group_by(Post.user_id).subquery()
+    likes = db.select(Post.user_id.label('user_id'), db.func.count(Like.id).label('n')).join(Like, Like.post_id == Post.id).group_by(Post.user_id).subquery()
+    comments = db.select(Post.user_id.label('user_id'), db.func.count(Comment.id).label('n')).join(Comment, Comment.post_id == Post.id).group_by(Post.user_id).subquery()
+    friends = db.select(Friend.owner_id.label('user_id'), db.func.count(Friend.id).label('n')).group_by(Friend.owner_id).subquery()
+    unread = _unread_source_query().subquery()
+    q = db.select(
+        User.id,
+        db.func.coalesce(posts.c.minutes, 0),
+        db.func.coalesce(posts.c.n, 0),
+        db.func.coalesce(likes.c.n, 0),
+        db.func.coalesce(comments.c.n, 0),
+        db.func.coalesce(friends.c.n, 0),
+        db.func.coalesce(unread.c.n, 0),
+    ).outerjoin(posts, posts.c.user_id == User.id).outerjoin(likes, likes.c.user_id == User.id).outerjoin(
+        comments, comments.c.user_id == User.id).outerjoin(friends, friends.c.user_id == User.id).outerjoin(
+        unread, unread.c.user_id == User.id)
+    if user_ids is not None:
+        q = q.where(User.id.in_(user_ids))
+    return q
+
+
+def _unread_source_query():
+    return db.select(Notification.user_id.label('user_id'), db.func.count(Notification.id).label('n')).where(
+        Notification.read.isnot(True)).group_by(Notification.user_id)
+
+
+def reconcile_unread_counts():
+    """Set every drifted unread_notifications counter from the notification table with one UPDATE;
+    returns the number of rows fixed. The outbox worker runs this periodically."""
+    actual = db.select(db.func.count(Notification.id)).where(
+        Notification.user_id == UserCounters.user_id, Notification.read.isnot(True)).scalar_subquery()
+    n = db.session.execute(db.update(UserCounters).where(UserCounters.unread_notifications != actual).values(
+        unread_notifications=actual), execution_options={'synchronize_session': False}).rowcount
+    db.session.commit()
+    return n or 0
+
+
+def unread_deltas_for(*criteria):
+    """{recipient_id: -unread} for the notifications matching criteria, to pass to
+    bump_counters_many before deleting them."""
+    rows = db.session.query(Notification.user_id, db.func.count(Notification.id)).filter(
+        Notification.read.isnot(True), *criteria).group_by(Notification.user_id).all()
+    return {uid: -n for uid, n in rows}
+
+
+def reconcile_counters(dry_run=False):
+    """Recompute every user's counters in bulk and return the drifted rows as
+    (user_id, expected, actual) with dicts (actual is None for a missing row). Unless dry_run,
+    drifted and missing rows are rewritten and rows of deleted users removed."""
+    expected = {r[0]: dict(zip(COUNTER_FIELDS, (int(v) for v in r[1:]))) for r in db.session.execute(_counters_source_query()).all()}
+    actual = {r.user_id: {k: int(getattr(r, k) or 0) for k in COUNTER_FIELDS} for r in UserCounters.query.all()}
+    drift = [(uid, expected.get(uid), actual.get(uid)) for uid in sorted(set(expected) | set(actual)) if expected.get(uid) != actual.get(uid)]
+    if drift and not dry_run:
+        stale = [uid for uid, exp, _ in drift if exp is None]
+        if stale:
+            UserCounters.query.filter(UserCounters.user_id.in_(stale)).delete(synchronize_session=False)
+        updates = [dict(exp, uid=uid) for uid, exp, act in drift if exp is not None and act is not None]
+        if updates:
+            sets = ', '.join(f'{k} = :{k}' for k in COUNTER_FIELDS)
+            db.session.execute(text(f'UPDATE user_counters SET {sets} WHERE user_id = :uid'), updates)
+        inserts = [dict(exp, user_id=uid) for uid, exp, act in drift if exp is not None and act is None]
+        if inserts:
+            db.session.execute(db.insert(UserCounters), inserts)
+        db.session.commit()
+    return drift
+
+
+def reconcile_comment_counts(dry_run=False):
+    """Set every drifted post.comment_count from the comment table with one UPDATE; returns the
+    number of drifted posts."""
+    actual = db.select(db.func.count(Comment.id)).where(Comment.post_id == Post.id).scalar_subquery()
+    if dry_run:
+        return db.session.query(db.func.count(Post.id)).filter(Post.comment_count != actual).scalar() or 0
+    n = db.session.execute(db.update(Post).where(Post.comment_count != actual).values(comment_count=actual, cache_version=Post.cache_version + 1),
+                           execution_options={'synchronize_session': False}).rowcount
+    db.session.commit()
+    return n or 0
+
+
+counters_cli = AppGroup('counters', help='Per-user aggregate counters (user_counters).')
+
+
+@counters_cli.command('reconcile')
+@click.option('--dry-run', is_flag=True, help='Only report drift, do not rewrite counters.')
+def counters_reconcile_command(dry_run):
+    """Recompute user_counters from the source tables and report drifted users."""
+    drift = reconcile_counters(dry_run=dry_run)
+    for user_id, expected, actual in drift[:50]:
+        click.echo(f'user={user_id} expected={expected} actual={actual}')
+    if len(drift) > 50:
+        click.echo(f'... and {len(drift) - 50} more')
+    click.echo(f'{len(drift)} drifted users' + (' (dry run, nothing changed)' if dry_run else ' (fixed)'))
+    posts = reconcile_comment_counts(dry_run=dry_run)
+    click.echo(f'{posts} posts with a drifted comment_count' + (' (dry run, nothing changed)' if dry_run else ' (fixed)'))
+
+
+app.cli.add_command(counters_cli)
+
+
+# --- Badge awarding helpers ---
 def ensure_badge_record(slug):
     """Ensure a Badge record exists for given slug; create it using BADGE_DEFINITIONS and any matching image in static/badges."""
     if slug not in BADGE_DEFINITIONS:
@@ -509,7 +1174,8 @@ def ensure_badge_record(slug):
             break
     # create badge
     try:
-        b = Badge(title=bdef['title'], desc=bdef['desc'], slug=bdef['slug'], image_filename=img, is_active=True)
+        b = Badge(title=bdef['title'], desc=bdef['desc'], slug=bdef['slug'], image_filename=img,
+                  criteria_json=badge_criteria_json(slug), is_active=True)
         db.session.add(b)
         db.session.commit()
         return b
@@ -518,126 +1184,826 @@ def ensure_badge_record(slug):
         return Badge.query.filter_by(slug=bdef['slug']).first()
 
 
-def award_badge_if_needed(user_id, slug):
-    if not user_id:
-        return False
-    b = Badge.query.filter_by(slug=slug).first()
-    if not b:
-        b = ensure_badge_record(slug)
-    if not b:
-        return False
-    # check if already awarded
-    exists = UserBadge.query.filter_by(user_id=user_id, badge_id=b.id).first()
-    if exists:
-        return False
+# --- Badge engine ---
+# Badge rules live in Badge.criteria_json ({"metric", "op", "threshold"}; see badge_definitions.py).
+# BADGE_EVENTS lists the metrics each event can move. Write paths enqueue a 'badge' outbox event; the
+# worker loads only those metrics (one SELECT) and awards only the thresholds crossed between the old
+# and new value with one INSERT ... ON CONFLICT.
+BADGE_EVENTS = {
+    'checkin': ('streak_days', 'total_minutes', 'post_count'),
+    'like_received': ('likes_received',),
+    'comment_received': ('comments_received',),
+    'friend_added': ('friend_count',),
+}
+BADGE_RULES_VERSION = 'badge_rules'
+BADGE_RULES_RECHECK = float(os.environ.get('BADGE_RULES_RECHECK', '5'))
+
+
+def _metric_expr(metric, user_id):
+    """Scalar SQL for one metric of one user, read from user_counters (streak from the user row)."""
+    if metric == 'streak_days':
+        return db.select(db.func.coalesce(User.streak_days, 0)).where(User.id == user_id).scalar_subquery()
+    if metric in COUNTER_FIELDS:
+        return db.select(getattr(UserCounters, metric)).where(UserCounters.user_id == user_id).scalar_subquery()
+    raise ValueError(f'unknown badge metric {metric}')
+
+
+def active_badge_rules(slug=None):
+    """(badge_id, slug, metric, min_value) for every active badge with a valid rule (or just `slug`),
+    creating missing built-in badges first. min_value is the smallest metric value that earns it."""
+    wanted = [slug] if slug else list(BADGE_DEFINITIONS)
+    existing = {s for (s,) in db.session.query(Badge.slug).filter(Badge.slug.in_(wanted)).all()}
+    for s in wanted:
+        if s not in existing and s in BADGE_DEFINITIONS:
+            ensure_badge_record(s)
+    q = db.session.query(Badge.id, Badge.slug, Badge.criteria_json).filter(Badge.is_active.isnot(False))
+    if slug:
+        q = q.filter(Badge.slug == slug)
+    out = []
+    for badge_id, s, raw in q.order_by(Badge.id).all():
+        if not raw and s in BADGE_DEFINITIONS:
+            # built-in badges created before criteria were stored
+            raw = badge_criteria_json(s)
+        if not raw:
+            continue
+        try:
+            metric, op, threshold = parse_criteria(raw)
+        except ValueError as e:
+            app.logger.warning('badge %s ignored: %s', s, e)
+            continue
+        # metrics are integers, so "> t" is ">= t + 1"
+        out.append((badge_id, s, metric, threshold + 1 if op == '>' else threshold))
+    return out
+
+
+class BadgeRuleIndex:
+    """Active badge rules compiled once per process into metric -> (sorted thresholds, badge ids),
+    so a metric moving from old to new bisects for the thresholds in (old, new]. Recompiled when the
+    shared 'badge_rules' version moves, which is checked at most every `recheck` seconds."""
+
+    def __init__(self, recheck):
+        self.recheck = recheck
+        self._lock = threading.Lock()
+        self._rules = None
+        self._version = None
+        self._checked_at = 0.0
+
+    def invalidate(self):
+        with self._lock:
+            self._rules = None
+
+    def _compile(self):
+        by_metric = {}
+        for badge_id, slug, metric, threshold in active_badge_rules():
+            by_metric.setdefault(metric, []).append((threshold, badge_id))
+        rules = {}
+        for metric, pairs in by_metric.items():
+            pairs.sort()
+            rules[metric] = ([t for t, _ in pairs], [b for _, b in pairs])
+        return rules
+
+    def rules(self):
+        now = time.monotonic()
+        with self._lock:
+            rules, version, checked_at = self._rules, self._version, self._checked_at
+        if rules is not None and now - checked_at < self.recheck:
+            return rules
+        current = db.session.query(CacheVersion.version).filter(CacheVersion.name == BADGE_RULES_VERSION).scalar() or 0
+        if rules is None or current != version:
+            rules = self._compile()
+        with self._lock:
+            self._rules, self._version, self._checked_at = rules, current, now
+        return rules
+
+    def crossed(self, metric, old, new):
+        """Badge ids whose threshold lies in (old, new]; old=None means every threshold up to new."""
+        entry = self.rules().get(metric)
+        if not entry or (old is not None and new <= old):
+            return []
+        thresholds, ids = entry
+        lo = 0 if old is None else bisect.bisect_right(thresholds, old)
+        return ids[lo:bisect.bisect_right(thresholds, new)]
+
+
+badge_rules = BadgeRuleIndex(BADGE_RULES_RECHECK)
+
+
+def award_badge_ids(user_id, badge_ids, commit=True):
+    """Insert-if-absent UserBadge rows; returns the number newly awarded. With commit=False the
+    insert joins the caller's transaction and errors propagate."""
+    ids = sorted(set(badge_ids))
+    if not user_id or not ids:
+        return 0
+    now = datetime.utcnow()
+    stmt = dialect_insert(UserBadge).values([{'user_id': user_id, 'badge_id': bid, 'earned_at': now, 'pinned': False} for bid in ids])
+    stmt = stmt.on_conflict_do_nothing(index_elements=['user_id', 'badge_id'])
+    if not commit:
+        return db.session.execute(stmt).rowcount or 0
     try:
-        ub = UserBadge(user_id=user_id, badge_id=b.id)
-        db.session.add(ub)
+        awarded = db.session.execute(stmt).rowcount or 0
         db.session.commit()
-        return True
+        return awarded
     except Exception:
         db.session.rollback()
-        return False
+        return 0
+
+
+def evaluate_badge_metrics(user_id, metrics, changes=None, commit=True):
+    """Award the badges crossed by `metrics`. changes maps metric -> (old, new) when the caller
+    knows them (e.g. from bump_counters); other metrics are loaded in one SELECT and checked up to
+    their current value."""
+    changes = dict(changes or {})
+    rules = badge_rules.rules()
+    metrics = [m for m in metrics if m in rules]
+    unknown = [m for m in metrics if m not in changes]
+    if unknown:
+        values = db.session.execute(db.select(*[_metric_expr(m, user_id) for m in unknown])).one()
+        changes.update({m: (None, int(v or 0)) for m, v in zip(unknown, values)})
+    badge_ids = []
+    for metric in metrics:
+        old, new = changes[metric]
+        badge_ids.extend(badge_rules.crossed(metric, old, new))
+    return award_badge_ids(user_id, badge_ids, commit=commit)
+
+
+def _qualifying_users(metric, min_value):
+    """SELECT of user ids whose metric is at least min_value."""
+    if metric == 'streak_days':
+        return db.select(User.id.label('user_id')).where(User.streak_days >= min_value)
+    return db.select(UserCounters.user_id).where(getattr(UserCounters, metric) >= min_value)
+
+
+def backfill_badge(badge_id, metric, min_value, dry_run=False):
+    """Award one badge to every qualifying user with a single INSERT ... SELECT (no per-user loop).
+    Returns (qualifying, newly_awarded); a dry run only counts."""
+    qualifying = _qualifying_users(metric, min_value).subquery()
+    total = db.session.execute(db.select(db.func.count()).select_from(qualifying)).scalar() or 0
+    if dry_run:
+        missing = db.session.execute(db.select(db.func.count()).select_from(qualifying).where(~db.exists().where(
+            UserBadge.user_id == qualifying.c.user_id, UserBadge.badge_id == badge_id))).scalar() or 0
+        return total, missing
+    # the (always true) WHERE keeps SQLite's INSERT ... SELECT ... ON CONFLICT unambiguous
+    rows = db.select(qualifying.c.user_id, db.literal(badge_id), db.literal(datetime.utcnow()), db.false()).where(qualifying.c.user_id.isnot(None))
+    stmt = dialect_insert(UserBadge).from_select(['user_id', 'badge_id', 'earned_at', 'pinned'], rows)
+    awarded = db.session.execute(stmt.on_conflict_do_nothing(index_elements=['user_id', 'badge_id'])).rowcount or 0
+    return total, awarded
+
+
+badges_cli = AppGroup('badges', help='Badge maintenance.')
+
+
+@badges_cli.command('backfill')
+@click.argument('slug', required=False)
+@click.option('--dry-run', is_flag=True, help='Only report how many users qualify / would be awarded.')
+def badges_backfill_command(slug, dry_run):
+    """Award SLUG (default: every active badge with a rule) to all users who already qualify."""
+    rules = active_badge_rules(slug)
+    if slug and not rules:
+        raise click.ClickException(f'no active badge with a valid rule for slug {slug!r}')
+    for badge_id, s, metric, min_value in rules:
+        total, count = backfill_badge(badge_id, metric, min_value, dry_run=dry_run)
+        verb = 'would award' if dry_run else 'awarded'
+        click.echo(f'{s}: {metric} >= {min_value}: {total} qualifying users, {verb} {count}')
+    if dry_run:
+        db.session.rollback()
+    else:
+        db.session.commit()
 
 
-def run_award_checks_on_user(user_id):
-    """Run all badge checks for a user (id). Uses posts/comments/likes/friends/streak/minutes thresholds."""
-    u = User.query.get(user_id)
-    if not u:
+app.cli.add_command(badges_cli)
+
+
+# --- Outbox (side effects processed off the request path) ---
+# Write paths enqueue notifications and badge checks as OutboxEvent rows in their own transaction;
+# a worker claims them in batches and runs the handlers. OUTBOX_MODE:
+#   thread   - a background thread in each app process (started on the first request that enqueues)
+#   external - only `flask worker` processes handle events
+#   inline   - handled right after the request's commit, before responding (tests / local debugging)
+# The default is thread, except on sqlite where a second writer thread would only contend for the file lock.
+OUTBOX_MODE = os.environ.get('OUTBOX_MODE') or ('inline' if app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite') else 'thread')
+OUTBOX_BATCH = int(os.environ.get('OUTBOX_BATCH', '100'))
+OUTBOX_POLL = float(os.environ.get('OUTBOX_POLL', '1'))
+OUTBOX_LEASE = 60
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_RETENTION_DAYS = 7
+
+
+def enqueue_event(kind, **payload):
+    """Record a side effect in the current transaction; it runs only if the caller commits."""
+    db.session.add(OutboxEvent(kind=kind, payload=json.dumps(payload)))
+    if has_request_context():
+        g.outbox_pending = True
+
+
+def _handle_notify(recipient_id, actor_id=None, verb='notify', post_id=None, comment_id=None, data=None, group_key=None):
+    if not wants_notifications(recipient_id):
+        return
+    if verb == 'like' and Like.query.filter_by(user_id=actor_id, post_id=post_id).first() is None:
+        # unliked before this event was handled
         return
-    # ensure badge records exist
-    for slug in BADGE_DEFINITIONS.keys():
-        ensure_badge_record(slug)
+    create_notification(recipient_id, actor_id=actor_id, verb=verb, post_id=post_id, comment_id=comment_id, data=data,
+                        commit=False, group_key=group_key)
 
-    # 1) streak badges
-    try:
-        sd = int(getattr(u, 'streak_days', 0) or 0)
-        if sd >= 3:
-            award_badge_if_needed(user_id, 'streak_3')
-        if sd >= 7:
-            award_badge_if_needed(user_id, 'streak_7')
-    except Exception:
-        pass
 
-    # 2) cumulative minutes -> hours
-    try:
-        total_minutes = db.session.query(db.func.coalesce(db.func.sum(Post.minutes), 0)).filter(Post.user_id == user_id).scalar() or 0
-        if total_minutes >= 50 * 60:
-            award_badge_if_needed(user_id, 'hours_50')
-        if total_minutes >= 100 * 60:
-            award_badge_if_needed(user_id, 'hours_100')
-        if total_minutes >= 500 * 60:
-            award_badge_if_needed(user_id, 'hours_500')
-    except Exception:
-        pass
+def _handle_unnotify(recipient_id, actor_id, group_key, post_id=None):
+    if post_id and Like.query.filter_by(user_id=actor_id, post_id=post_id).first() is not None:
+        # liked again before this event was handled
+        return
+    remove_notification_actor(recipient_id, actor_id, group_key)
+
+
+def _handle_mentions(message, actor_id=None, post_id=None, comment_id=None):
+    names = set(re.findall(r'@([A-Za-z0-9_\-]+)', message or ''))
+    if not names:
+        return
+    group_key = notification_group_key('mention', post_id)
+    for uid in db.session.query(User.id).filter(User.username.in_(names), User.notify.isnot(False)).all():
+        if uid[0] != actor_id:
+            create_notification(uid[0], actor_id=actor_id, verb='mention', post_id=post_id, comment_id=comment_id, data=message,
+                                commit=False, group_key=group_key)
+
+
+def _handle_badge(user_id, event, changes=None):
+    if db.session.get(User, user_id) is None:
+        return
+    evaluate_badge_metrics(user_id, BADGE_EVENTS[event], changes, commit=False)
+
+
+OUTBOX_HANDLERS = {
+    'notify': _handle_notify,
+    'unnotify': _handle_unnotify,
+    'mentions': _handle_mentions,
+    'badge': _handle_badge,
+}
+
+
+def claim_outbox_batch(limit):
+    """Lease up to `limit` due events to this worker: (id, kind, payload, attempts) rows. The lease
+    makes a crashed worker's events due again after OUTBOX_LEASE seconds."""
+    now = datetime.utcnow()
+    due = db.select(OutboxEvent.id).where(OutboxEvent.status == 'pending', OutboxEvent.available_at <= now).order_by(OutboxEvent.id).limit(limit)
+    if db.engine.dialect.name == 'postgresql':
+        due = due.with_for_update(skip_locked=True)
+    stmt = db.update(OutboxEvent).where(OutboxEvent.id.in_(due.scalar_subquery()), OutboxEvent.available_at <= now).values(
+        available_at=now + timedelta(seconds=OUTBOX_LEASE), attempts=OutboxEvent.attempts + 1
+    ).returning(OutboxEvent.id, OutboxEvent.kind, OutboxEvent.payload, OutboxEvent.attempts)
+    rows = db.session.execute(stmt, execution_options={'synchronize_session': False}).all()
+    if db.engine.dialect.name != 'sqlite':
+        db.session.commit()
+    # on sqlite the batch keeps the write lock taken here: reading in the handlers and only then
+    # asking for it again would fail fast ("database is locked") against concurrent writers
+    return sorted(rows)
+
+
+def process_outbox_batch(limit=OUTBOX_BATCH):
+    """Claim and handle one batch. Each event runs in a savepoint and the whole batch commits once;
+    failures are retried with exponential backoff and parked as 'dead' after OUTBOX_MAX_ATTEMPTS.
+    Returns the number of events claimed."""
+    # compile badge rules outside the batch transaction (it may create built-in badges)
+    badge_rules.rules()
+    rows = claim_outbox_batch(limit)
+    if not rows:
+        return 0
+    done, failed = [], []
+    for event_id, kind, payload, attempts in rows:
+        try:
+            with db.session.begin_nested():
+                OUTBOX_HANDLERS[kind](**json.loads(payload or '{}'))
+            done.append(event_id)
+        except Exception as e:
+            app.logger.warning('outbox event %s (%s) failed on attempt %s: %r', event_id, kind, attempts, e)
+            failed.append((event_id, attempts, repr(e)[:500]))
+    now = datetime.utcnow()
+    if done:
+        db.session.execute(db.update(OutboxEvent).where(OutboxEvent.id.in_(done)).values(status='done', processed_at=now),
+                           execution_options={'synchronize_session': False})
+    for event_id, attempts, error in failed:
+        dead = attempts >= OUTBOX_MAX_ATTEMPTS
+        db.session.execute(db.update(OutboxEvent).where(OutboxEvent.id == event_id).values(
+            status='dead' if dead else 'pending', last_error=error, processed_at=now if dead else None,
+            available_at=now + timedelta(seconds=min(2 ** attempts, 300))), execution_options={'synchronize_session': False})
+    db.session.commit()
+    return len(rows)
+
+
+def purge_outbox(days=OUTBOX_RETENTION_DAYS):
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    n = OutboxEvent.query.filter(OutboxEvent.status == 'done', OutboxEvent.processed_at < cutoff).delete(synchronize_session=False)
+    db.session.commit()
+    return n
+
+
+def run_outbox_loop(stop=None, wake=None, batch=OUTBOX_BATCH):
+    """Process events until `stop` is set: back-to-back while there is a backlog, otherwise wait up
+    to OUTBOX_POLL seconds (or until woken). About once an hour done events are purged and the
+    unread-notification counters reconciled."""
+    last_purge = 0.0
+    while not (stop and stop.is_set()):
+        try:
+            with app.app_context():
+                claimed = process_outbox_batch(batch)
+                if time.monotonic() - last_purge > 3600:
+                    last_purge = time.monotonic()
+                    purge_outbox()
+                    reconcile_unread_counts()
+        except Exception:
+            app.logger.exception('outbox worker error')
+            claimed = 0
+        if claimed < batch:
+            if wake is not None:
+                wake.wait(OUTBOX_POLL)
+                wake.clear()
+            else:
+                time.sleep(OUTBOX_POLL)
+
+
+class OutboxThread:
+    """One daemon worker thread per app process (i.e. per gunicorn worker), started lazily."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self._wake = threading.Event()
+
+    def ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=run_outbox_loop, kwargs={'wake': self._wake}, name='outbox-worker', daemon=True)
+                self._thread.start()
+
+    def wake(self):
+        self._wake.set()
+
+
+outbox_thread = OutboxThread()
+
+
+@app.after_request
+def _dispatch_outbox(response):
+    if not g.get('outbox_pending'):
+        return response
+    g.outbox_pending = False
+    if OUTBOX_MODE == 'inline':
+        try:
+            while process_outbox_batch(OUTBOX_BATCH) == OUTBOX_BATCH:
+                pass
+        except Exception:
+            db.session.rollback()
+            app.logger.exception('inline outbox processing failed')
+    elif OUTBOX_MODE == 'thread':
+        outbox_thread.ensure_started()
+        outbox_thread.wake()
+    return response
+
+
+@app.cli.command('worker')
+@click.option('--once', is_flag=True, help='Process what is due now and exit.')
+@click.option('--batch', default=OUTBOX_BATCH, show_default=True, help='Events claimed per round.')
+def outbox_worker_command(once, batch):
+    """Process outbox events (notifications, badge checks) until interrupted."""
+    if once:
+        total = 0
+        while True:
+            claimed = process_outbox_batch(batch)
+            total += claimed
+            if claimed < batch:
+                break
+        click.echo(f'processed {total} events')
+        return
+    click.echo('outbox worker running (Ctrl+C to stop)')
+    run_outbox_loop(batch=batch)
+
+
+# --- Live events (Server-Sent Events) ---
+# Writes call publish_live() in their own transaction. Each app process runs one LiveEventHub thread
+# that polls live_event (one indexed query per LIVE_POLL seconds however many clients are connected)
+# and hands rows to the in-process queues of its /events streams, so an event reaches clients on
+# every gunicorn worker. Topics: user:<id> (notifications, unread count) and post:<id> (likes, comments).
+# Every open stream holds a worker thread, so a process serves at most LIVE_MAX_STREAMS of them and
+# keeps them short; clients over the cap are told to retry later and the page works without live updates.
+LIVE_POLL = float(os.environ.get('LIVE_POLL', '1'))
+LIVE_EVENT_TTL = 300
+LIVE_WINDOW = 10  # seconds re-read on each poll, so rows committed out of id order are not missed
+LIVE_STREAM_SECONDS = float(os.environ.get('LIVE_STREAM_SECONDS', '60'))
+LIVE_MAX_STREAMS = int(os.environ.get('LIVE_MAX_STREAMS', '4'))
+LIVE_BUSY_RETRY_MS = 30000
+LIVE_KEEPALIVE = 15
+LIVE_MAX_POSTS = 100
+LIVE_QUEUE_SIZE = 200
+
+
+def publish_live(topic, kind, **data):
+    """Queue a live event in the current transaction; streams see it only if the caller commits."""
+    db.session.add(LiveEvent(topic=topic, kind=kind, data=json.dumps(data)))
+
+
+def live_unread_event(user_id, moved):
+    """Publish a user's new unread count from a bump_counters() result (no-op if it was not returned)."""
+    if 'unread_notifications' in moved:
+        publish_live(f'user:{user_id}', 'unread', unread=moved['unread_notifications'][1])
+
+
+class LiveEventHub:
+    """Per-process fan-out from live_event to the /events streams of this process."""
+
+    def __init__(self, poll):
+        self.poll = poll
+        self._lock = threading.Lock()
+        self._subscribers = {}  # queue -> set of topics
+        self._seen = OrderedDict()  # ids delivered within the last LIVE_WINDOW seconds
+        self._thread = None
+        self._pruned_at = 0.0
+
+    def subscribe(self, topics, limit=None):
+        """A queue receiving rows for `topics`, or None when `limit` streams are already open."""
+        q = queue.Queue(maxsize=LIVE_QUEUE_SIZE)
+        with self._lock:
+            if limit is not None and len(self._subscribers) >= limit:
+                return None
+            self._subscribers[q] = set(topics)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='live-events', daemon=True)
+                self._thread.start()
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subscribers.pop(q, None)
+
+    def _poll_once(self):
+        now = datetime.utcnow()
+        rows = db.session.query(LiveEvent.id, LiveEvent.topic, LiveEvent.kind, LiveEvent.data).filter(
+            LiveEvent.created_at >= now - timedelta(seconds=LIVE_WINDOW)).order_by(LiveEvent.id).all()
+        db.session.commit()
+        with self._lock:
+            subscribers = list(self._subscribers.items())
+        for row in rows:
+            if row.id in self._seen:
+                continue
+            self._seen[row.id] = now
+            for q, topics in subscribers:
+                if row.topic in topics:
+                    try:
+                        q.put_nowait(row)
+                    except queue.Full:
+                        pass  # a stalled client misses events; it resyncs on reconnect
+        cutoff = now - timedelta(seconds=LIVE_WINDOW * 2)
+        while self._seen and next(iter(self._seen.values())) < cutoff:
+            self._seen.popitem(last=False)
+        if time.monotonic() - self._pruned_at > 60:
+            self._pruned_at = time.monotonic()
+            LiveEvent.query.filter(LiveEvent.created_at < now - timedelta(seconds=LIVE_EVENT_TTL)).delete(synchronize_session=False)
+            db.session.commit()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._subscribers:
+                    self._thread = None
+                    return
+            try:
+                with app.app_context():
+                    self._poll_once()
+            except Exception:
+                app.logger.exception('live event poll failed')
+            time.sleep(self.poll)
+
+
+live_hub = LiveEventHub(LIVE_POLL)
+
+
+def _sse(row):
+    return f'id: {row.id}\nevent: {row.kind}\ndata: {row.data}\n\n'
+
+
+@app.route('/events')
+@login_required
+def live_events():
+    """SSE stream of the viewer's notifications and unread count, plus like/comment updates for the
+    posts listed in ?posts=1,2,3. Streams end after LIVE_STREAM_SECONDS; EventSource reconnects and
+    Last-Event-ID (or ?last_id=) replays what was missed. Over LIVE_MAX_STREAMS the response only
+    sets a long retry: a non-200 status would make EventSource give up for good."""
+    post_ids = []
+    for part in (request.args.get('posts') or '').split(',')[:LIVE_MAX_POSTS]:
+        if part.strip().isdigit():
+            post_ids.append(int(part))
+    user_id = current_user.id
+    topics = {f'user:{user_id}'} | {f'post:{pid}' for pid in post_ids}
+    q = live_hub.subscribe(topics, limit=LIVE_MAX_STREAMS)
+    if q is None:
+        return Response(f'retry: {LIVE_BUSY_RETRY_MS}\n\n', mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+    last_id = request.headers.get('Last-Event-ID') or request.args.get('last_id')
+    backlog = []
+    if last_id and str(last_id).isdigit():
+        backlog = db.session.query(LiveEvent.id, LiveEvent.topic, LiveEvent.kind, LiveEvent.data).filter(
+            LiveEvent.id > int(last_id), LiveEvent.topic.in_(topics)).order_by(LiveEvent.id).limit(LIVE_QUEUE_SIZE).all()
+    db.session.remove()  # don't hold a pooled connection for the life of the stream
+
+    def stream():
+        sent = backlog[-1].id if backlog else 0
+        try:
+            yield 'retry: 3000\n\n'
+            for row in backlog:
+                yield _sse(row)
+            deadline = time.monotonic() + LIVE_STREAM_SECONDS
+            while time.monotonic() < deadline:
+                try:
+                    row = q.get(timeout=max(min(LIVE_KEEPALIVE, deadline - time.monotonic()), 0.1))
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                if row.id <= sent:
+                    continue
+                if row.kind == 'comment' and json.loads(row.data).get('actor_id') == user_id:
+                    continue  # the commenter's page already shows it
+                yield _sse(row)
+        finally:
+            live_hub.unsubscribe(q)
+
+    return Response(stream(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+# --- Leaderboard standings (in-process, top-K + rank lookups) ---
+LEADERBOARD_TTL = float(os.environ.get('LEADERBOARD_TTL', '60'))
+LEADERBOARD_TOP_N = int(os.environ.get('LEADERBOARD_TOP_N', '50'))
+LEADERBOARD_NEIGHBOURS = 2
+
+
+class LeaderboardStandings:
+    """Sorted standings for one window. Entries are (-points, user_id) so the list sorts best-first;
+    rank lookups are bisects, i.e. O(log n). Only users with points are stored."""
+
+    def __init__(self, points_by_user, start_date):
+        self.start_date = start_date
+        self.points = {uid: pts for uid, pts in points_by_user.items() if pts > 0}
+        self.entries = sorted((-pts, uid) for uid, pts in self.points.items())
+
+    def add(self, user_id, delta):
+        old = self.points.get(user_id, 0)
+        new = old + delta
+        if old > 0:
+            i = bisect.bisect_left(self.entries, (-old, user_id))
+            if i < len(self.entries) and self.entries[i] == (-old, user_id):
+                del self.entries[i]
+        if new > 0:
+            self.points[user_id] = new
+            bisect.insort(self.entries, (-new, user_id))
+        else:
+            self.points.pop(user_id, None)
+
+    def rank_for_points(self, pts):
+        """Competition rank: 1 + number of users with strictly more points."""
+        return bisect.bisect_left(self.entries, (-pts, -1)) + 1
+
+    def top(self, n):
+        return [(uid, -neg, self.rank_for_points(-neg)) for neg, uid in self.entries[:n]]
+
+    def around(self, user_id, k):
+        """(rank, points, neighbours) for a user; users without points share the last rank."""
+        pts = self.points.get(user_id, 0)
+        if pts <= 0:
+            tail = self.entries[-k:] if k else []
+            return len(self.entries) + 1, 0, [(uid, -neg, self.rank_for_points(-neg)) for neg, uid in tail]
+        i = bisect.bisect_left(self.entries, (-pts, user_id))
+        window = self.entries[max(0, i - k):i + k + 1]
+        return self.rank_for_points(pts), pts, [(uid, -neg, self.rank_for_points(-neg)) for neg, uid in window]
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class LeaderboardService:
+    """Holds the standings for a rolling window of local days (days=None for all time) and refreshes
+    them from the rollups at most once per TTL. Refresh is single-flight: one request recomputes while the others
+    keep serving the previous standings. Check-ins handled by this worker are applied immediately."""
+
+    def __init__(self, days, ttl):
+        self.days = days
+        self.ttl = ttl
+        self._standings = None
+        self._expires = 0.0
+        self._refresh_lock = threading.Lock()
+        self._update_lock = threading.Lock()
+
+    def _start_date(self):
+        if self.days is None:
+            return None
+        return local_today() - timedelta(days=self.days - 1)
+
+    def _compute(self):
+        start = self._start_date()
+        rows = minutes_since_query(start).all()
+        return LeaderboardStandings({r.user_id: int(r.minutes or 0) for r in rows}, start)
+
+    def standings(self):
+        cur = self._standings
+        fresh = cur is not None and time.monotonic() < self._expires and cur.start_date == self._start_date()
+        if fresh:
+            return cur
+        # the first caller recomputes; concurrent callers use the stale copy if there is one
+        if self._refresh_lock.acquire(blocking=cur is None):
+            try:
+                if self._standings is cur:
+                    self._standings = self._compute()
+                    self._expires = time.monotonic() + self.ttl
+            finally:
+                self._refresh_lock.release()
+        return self._standings or cur
+
+    def record(self, user_id, local_date, delta):
+        """Apply a committed minutes change to the in-memory standings if it falls in the window."""
+        cur = self._standings
+        if cur is None or not delta or local_date is None:
+            return
+        if cur.start_date is not None and local_date < cur.start_date:
+            return
+        with self._update_lock:
+            cur.add(user_id, delta)
+
+    def invalidate(self):
+        self._expires = 0.0
+
+
+# window name -> number of local days (None = all time, served from user_counters.total_minutes)
+LEADERBOARD_WINDOWS = {'today': 1, 'week': 7, 'month': 30, 'all': None}
+LEADERBOARD_WINDOW_LABELS = {'today': '今日', 'week': '本週', 'month': '近 30 天', 'all': '總累積'}
+leaderboard_services = {name: LeaderboardService(days, LEADERBOARD_TTL) for name, days in LEADERBOARD_WINDOWS.items()}
+
+
+def note_minutes_change(user_id, local_date, delta):
+    """Hook for committed check-in/edit/delete changes: keeps this worker's standings current."""
+    for service in leaderboard_services.values():
+        try:
+            service.record(user_id, local_date, delta)
+        except Exception:
+            service.invalidate()
+
+
+def _leaderboard_rows(entries):
+    """Hydrate (user_id, points, rank) tuples with names/avatars in one query."""
+    ids = {uid for uid, _, _ in entries}
+    users = {u.id: u for u in User.query.filter(User.id.in_(ids)).all()} if ids else {}
+    out = []
+    for uid, pts, rank in entries:
+        u = users.get(uid)
+        if not u:
+            continue
+        out.append({'id': uid, 'name': u.display_name or u.username, 'points': int(pts), 'avatar': avatar_url_for(u), 'rank': rank})
+    return out
+
+
+# --- Weekly leaderboard snapshots ---
+LEADERBOARD_HISTORY_TOP_N = 10
+
+
+def week_start_of(day):
+    """Monday of the (Asia/Taipei) week containing day."""
+    return day - timedelta(days=day.weekday())
+
+
+def last_completed_week_start():
+    return week_start_of(local_today()) - timedelta(days=7)
+
+
+def freeze_week(week_start):
+    """Freeze one completed week's standings from the daily rollup. Idempotent and safe to run
+    from several workers at once: the LeaderboardWeek insert is ON CONFLICT DO NOTHING, and only
+    the transaction that actually inserted it writes the ranks. Returns True if this call froze it."""
+    claim = dialect_insert(LeaderboardWeek).values(week_start=week_start, frozen_at=datetime.utcnow()).on_conflict_do_nothing(index_elements=['week_start'])
+    if db.session.execute(claim).rowcount != 1:
+        db.session.rollback()
+        return False
+    week_end = week_start + timedelta(days=6)
+    totals = db.select(UserDailyMinutes.user_id.label('user_id'), db.func.sum(UserDailyMinutes.minutes).label('points')).where(
+        UserDailyMinutes.local_date >= week_start, UserDailyMinutes.local_date <= week_end
+    ).group_by(UserDailyMinutes.user_id).subquery()
+    ranked = db.select(
+        db.literal(week_start), db.func.rank().over(order_by=totals.c.points.desc()), totals.c.user_id, totals.c.points
+    ).where(totals.c.points > 0)
+    db.session.execute(db.insert(LeaderboardSnapshot).from_select(['week_start', 'rank', 'user_id', 'points'], ranked))
+    db.session.commit()
+    return True
+
+
+def freeze_completed_weeks(weeks=1):
+    """Freeze the last `weeks` completed weeks that are not frozen yet. Returns the week starts frozen."""
+    last = last_completed_week_start()
+    starts = [last - timedelta(days=7 * i) for i in range(weeks)]
+    done = {r[0] for r in db.session.query(LeaderboardWeek.week_start).filter(LeaderboardWeek.week_start.in_(starts)).all()}
+    frozen = []
+    for ws in starts:
+        if ws not in done and freeze_week(ws):
+            frozen.append(ws)
+    return frozen
+
+
+def weekly_history(weeks, top_n=LEADERBOARD_HISTORY_TOP_N):
+    """Most recent frozen weeks with their top entries, read only from the snapshot tables."""
+    starts = [r[0] for r in db.session.query(LeaderboardWeek.week_start).order_by(LeaderboardWeek.week_start.desc()).limit(weeks).all()]
+    if not starts:
+        return []
+    rows = LeaderboardSnapshot.query.filter(LeaderboardSnapshot.week_start.in_(starts), LeaderboardSnapshot.rank <= top_n).order_by(
+        LeaderboardSnapshot.week_start.desc(), LeaderboardSnapshot.rank, LeaderboardSnapshot.user_id).all()
+    history = {ws: [] for ws in starts}
+    for r in rows:
+        history[r.week_start].append((r.user_id, r.points, r.rank))
+    history = {ws: _leaderboard_rows(entries) for ws, entries in history.items()}
+    return [{'week_start': ws.isoformat(), 'week_end': (ws + timedelta(days=6)).isoformat(), 'entries': history[ws]} for ws in starts]
+
+
+leaderboard_cli = AppGroup('leaderboard', help='Leaderboard maintenance.')
+
 
-    # 3) comments received on user's posts
+@leaderboard_cli.command('snapshot')
+@click.option('--weeks', default=1, show_default=True, help='How many recent completed weeks to make sure are frozen.')
+def leaderboard_snapshot_command(weeks):
+    """Freeze completed weeks' standings (run weekly, e.g. Monday 00:05 Asia/Taipei)."""
+    frozen = freeze_completed_weeks(weeks)
+    click.echo('frozen weeks: ' + (', '.join(ws.isoformat() for ws in frozen) if frozen else 'none (already frozen)'))
+
+
+app.cli.add_command(leaderboard_cli)
+
+
+@app.route('/leaderboard/history')
+def leaderboard_history_page():
+    # make sure last week is frozen (cheap primary-key check when it already is)
     try:
-        post_ids = [r[0] for r in db.session.query(Post.id).filter(Post.user_id == user_id).all()]
-        comment_count = 0
-        like_count = 0
-        if post_ids:
-            comment_count = db.session.query(db.func.count(Comment.id)).filter(Comment.post_id.in_(post_ids)).scalar() or 0
-            like_count = db.session.query(db.func.count(Like.id)).filter(Like.post_id.in_(post_ids)).scalar() or 0
-        if comment_count >= 5:
-            award_badge_if_needed(user_id, 'comments_5')
-        if like_count >= 10:
-            award_badge_if_needed(user_id, 'likes_10')
+        freeze_completed_weeks(1)
     except Exception:
-        pass
+        db.session.rollback()
+    history = weekly_history(8)
+    return render_template('leaderboard_history.html', history=history)
+
 
-    # 4) friend counts
+@app.route('/api/leaderboard/history')
+def leaderboard_history_api():
     try:
-        friend_count = Friend.query.filter_by(owner_id=user_id).count()
-        if friend_count >= 3:
-            award_badge_if_needed(user_id, 'friends_3')
-        if friend_count >= 10:
-            award_badge_if_needed(user_id, 'friends_10')
+        weeks = max(1, min(int(request.args.get('weeks', 4)), 52))
     except Exception:
-        pass
+        weeks = 4
+    return jsonify({'ok': True, 'weeks': weekly_history(weeks)})
+
+
+def _leaderboard_window():
+    window = request.args.get('window') or 'week'
+    return window if window in LEADERBOARD_WINDOWS else 'week'
+
 
+def friends_leaderboard(viewer_id, window):
+    """Standings for the viewer and their friends; friend ids come from a join, not a username list."""
+    days = LEADERBOARD_WINDOWS[window]
+    start_date = local_today() - timedelta(days=days - 1) if days else None
+    points = minutes_since_query(start_date).subquery()
+    points_expr = db.func.coalesce(points.c.minutes, 0).label('points')
+    results = db.session.query(User.id, points_expr).outerjoin(points, points.c.user_id == User.id).filter(
+        or_(User.id == viewer_id, User.id.in_(friend_ids_subquery(viewer_id)))
+    ).order_by(db.desc('points'), User.id).all()
+    entries, prev, rank = [], None, 0
+    for i, r in enumerate(results):
+        pts = int(r.points or 0)
+        if pts != prev:
+            rank, prev = i + 1, pts
+        entries.append((r.id, pts, rank))
+    return entries
 
 
 @app.route('/leaderboard')
 def leaderboard_page():
-    # Calculate leaderboard based on total minutes in the last 7 days
+    # windows: today / week (7 days) / month (30 days) / all, all served from the rollup buckets
     badges = Badge.query.all()
-    today = datetime.utcnow().date()
-    start_date = datetime.combine(today - timedelta(days=6), datetime.min.time())
-    end_date = datetime.combine(today, datetime.max.time())
-
-    # Sum minutes per user for posts in the last 7 days; include users with zero via outerjoin
-    minutes_expr = db.func.coalesce(db.func.sum(
-        case((and_(Post.created_at >= start_date, Post.created_at <= end_date), Post.minutes), else_=0)
-    ), 0).label('points')
-
+    window = _leaderboard_window()
     # allow mode: friends or all
     mode = (request.args.get('mode') or 'all')
-    q = db.session.query(User.id, User.display_name, User.username, minutes_expr).outerjoin(Post, Post.user_id == User.id).group_by(User.id)
+    me = None
     if mode == 'friends' and current_user.is_authenticated:
-        # collect friend ids (friends of current user) and include current user
-        friend_entries = Friend.query.filter_by(owner_id=current_user.id).all()
-        friend_usernames = [f.friend_name for f in friend_entries]
-        # include self
-        friend_usernames.append(current_user.username)
-        # get user ids
-        friend_users = User.query.filter(User.username.in_(friend_usernames)).all()
-        friend_ids = [u.id for u in friend_users]
-        if friend_ids:
-            q = q.filter(User.id.in_(friend_ids))
-
-    q = q.order_by(db.desc('points'))
-    results = q.all()
-
-    leaderboard = []
-    for r in results:
-        name = r.display_name or r.username
-        # fetch avatar if available
-        u = User.query.get(r.id)
-        avatar = u.avatar if u else None
-        leaderboard.append({'id': r.id, 'name': name, 'points': int(r.points) if r.points is not None else 0, 'avatar': avatar})
-
-    return render_template('leaderboard.html', leaderboard=leaderboard, badges=badges, mode=mode)
+        leaderboard = _leaderboard_rows(friends_leaderboard(current_user.id, window))
+    else:
+        standings = leaderboard_services[window].standings()
+        leaderboard = _leaderboard_rows(standings.top(LEADERBOARD_TOP_N))
+        if current_user.is_authenticated:
+            rank, pts, neighbours = standings.around(current_user.id, LEADERBOARD_NEIGHBOURS)
+            shown = {row['id'] for row in leaderboard}
+            me = {'rank': rank, 'points': pts, 'neighbours': [] if current_user.id in shown else _leaderboard_rows(neighbours)}
+
+    return render_template('leaderboard.html', leaderboard=leaderboard, badges=badges, mode=mode, me=me,
+                           window=window, windows=LEADERBOARD_WINDOW_LABELS)
+
+
+@app.route('/api/leaderboard')
+def leaderboard_api():
+    """Top N of a window's standings plus the current user's rank and neighbours."""
+    try:
+        n = max(1, min(int(request.args.get('n', LEADERBOARD_TOP_N)), 200))
+    except Exception:
+        n = LEADERBOARD_TOP_N
+    window = _leaderboard_window()
+    standings = leaderboard_services[window].standings()
+    out = {'ok': True, 'window': window, 'top': _leaderboard_rows(standings.top(n)), 'total_ranked': len(standings)}
+    if current_user.is_authenticated:
+        rank, pts, neighbours = standings.around(current_user.id, LEADERBOARD_NEIGHBOURS)
+        out['me'] = {'rank': rank, 'points': pts, 'neighbours': _leaderboard_rows(neighbours)}
+    return jsonify(out)
 
 
 @app.route('/badges')
@@ -659,6 +2025,16 @@ def badges_page():
     return render_template('badges.html', badges=badge_list)
 
 
+def criteria_from_form(form):
+    """criteria_json from the admin form's metric/op/threshold fields; None when no metric is chosen."""
+    metric = (form.get('metric') or '').strip()
+    if not metric:
+        return None
+    rule = {'metric': metric, 'op': form.get('op') or '>=', 'threshold': form.get('threshold')}
+    metric, op, threshold = parse_criteria(rule)
+    return json.dumps({'metric': metric, 'op': op, 'threshold': threshold})
+
+
 @app.route('/admin/badges', methods=['GET', 'POST'])
 @login_required
 def admin_badges():
@@ -666,9 +2042,32 @@ def admin_badges():
         flash('沒有權限')
         return redirect(url_for('index'))
 
+    if request.method == 'POST' and request.form.get('action') == 'update':
+        # edit an existing badge's rule / active flag
+        b = Badge.query.get(int(request.form.get('badge_id', 0) or 0))
+        if not b:
+            flash('找不到徽章')
+            return redirect(url_for('admin_badges'))
+        try:
+            b.criteria_json = criteria_from_form(request.form)
+        except ValueError:
+            flash('徽章條件格式錯誤')
+            return redirect(url_for('admin_badges'))
+        b.is_active = request.form.get('active') == '1'
+        bump_cache_versions([BADGE_RULES_VERSION])
+        db.session.commit()
+        badge_rules.invalidate()
+        flash('徽章已更新')
+        return redirect(url_for('admin_badges'))
+
     if request.method == 'POST':
         title = request.form.get('title', '').strip()
         desc = request.form.get('desc', '').strip()
+        try:
+            criteria = criteria_from_form(request.form)
+        except ValueError:
+            flash('徽章條件格式錯誤')
+            return redirect(url_for('admin_badges'))
         slug = request.form.get('slug', '').strip() or (title.replace(' ', '_').lower() if title else '')
         file = request.files.get('image')
         image_filename = None
@@ -684,9 +2083,13 @@ def admin_badges():
 
         # create badge record
         try:
-            b = Badge(title=title or (slug or 'unnamed'), desc=desc or '', slug=slug or str(uuid.uuid4().hex), image_filename=image_filename, is_active=True)
+            b = Badge(title=title or (slug or 'unnamed'), desc=desc or '', slug=slug or str(uuid.uuid4().hex), image_filename=image_filename,
+                      criteria_json=criteria, is_active=True)
             db.session.add(b)
+            # every worker recompiles its badge rules
+            bump_cache_versions([BADGE_RULES_VERSION])
             db.session.commit()
+            badge_rules.invalidate()
             flash('徽章已新增')
             return redirect(url_for('admin_badges'))
         except Exception:
@@ -698,34 +2101,120 @@ def admin_badges():
     badge_list = []
     for b in badges:
         img_url = url_for('static', filename=f'badges/{b.image_filename}') if b.image_filename else None
-        badge_list.append({'id': b.id, 'title': b.title, 'desc': b.desc, 'slug': b.slug, 'image': img_url, 'active': b.is_active})
-    return render_template('badges_admin.html', badges=badge_list)
+        rule = None
+        raw = b.criteria_json or (badge_criteria_json(b.slug) if b.slug in BADGE_DEFINITIONS else None)
+        if raw:
+            try:
+                rule = dict(zip(('metric', 'op', 'threshold'), parse_criteria(raw)))
+            except ValueError:
+                rule = None
+        badge_list.append({'id': b.id, 'title': b.title, 'desc': b.desc, 'slug': b.slug, 'image': img_url, 'active': b.is_active, 'rule': rule})
+    return render_template('badges_admin.html', badges=badge_list, metrics=BADGE_METRICS, operators=BADGE_OPERATORS)
+
+
+# --- Activity stats ---
+STATS_MAX_DAYS = 366
+
+
+def heat_level(minutes):
+    """0-4 intensity bucket for a day's minutes in the calendar heatmap."""
+    if minutes <= 0:
+        return 0
+    if minutes < 15:
+        return 1
+    if minutes < 30:
+        return 2
+    if minutes < 60:
+        return 3
+    return 4
+
+
+def activity_summary(user_id, days=365):
+    """Per-day and per-sport totals for the last `days` Asia/Taipei days (today included), from a
+    single GROUP BY over (Post.local_date, sport) on the (user_id, local_date) index. Shares are not the sharer's own activity and are skipped."""
+    today = local_today()
+    start = today - timedelta(days=days - 1)
+    rows = db.session.query(
+        Post.local_date, Post.sport, db.func.coalesce(db.func.sum(Post.minutes), 0), db.func.count(Post.id)
+    ).filter(
+        Post.user_id == user_id,
+        Post.local_date >= start,
+        Post.shared_from_id.is_(None),
+    ).group_by(Post.local_date, Post.sport).all()
+    by_day = {}
+    by_sport = {}
+    for day, sport, minutes, posts in rows:
+        if isinstance(day, str):
+            day = date.fromisoformat(day)
+        minutes = int(minutes or 0)
+        cell = by_day.setdefault(day, [0, 0])
+        cell[0] += minutes
+        cell[1] += posts
+        sport = sport or '其他'
+        agg = by_sport.setdefault(sport, [0, 0])
+        agg[0] += minutes
+        agg[1] += posts
+    return {
+        'start': start,
+        'end': today,
+        'by_day': by_day,
+        'sports': sorted(({'sport': s, 'minutes': m, 'posts': n} for s, (m, n) in by_sport.items()), key=lambda x: (-x['minutes'], x['sport'])),
+        'total_minutes': sum(c[0] for c in by_day.values()),
+        'active_days': sum(1 for c in by_day.values() if c[1] > 0),
+    }
+
+
+def heatmap_weeks(summary):
+    """Monday-start week columns of {date, minutes, level} cells covering summary's range; days
+    outside the range are None so the grid stays aligned."""
+    start, end, by_day = summary['start'], summary['end'], summary['by_day']
+    day = start - timedelta(days=start.weekday())
+    weeks = []
+    while day <= end:
+        week = []
+        for _ in range(7):
+            if start <= day <= end:
+                minutes = by_day.get(day, (0, 0))[0]
+                week.append({'date': day.isoformat(), 'minutes': minutes, 'level': heat_level(minutes)})
+            else:
+                week.append(None)
+            day += timedelta(days=1)
+        weeks.append(week)
+    return weeks
+
 
 @app.route('/stats')
 def stats():
-    # Compute recent 7 days activity for current_user from Post table
-    recent_7_days = []
+    today = local_today()
+    # build list of last 7 Asia/Taipei dates (oldest first)
+    dates = [(today - timedelta(days=i)) for i in range(6, -1, -1)]
+    summary = None
     if current_user.is_authenticated:
-        today = datetime.utcnow().date()
-        # build list of last 7 dates (oldest first)
-        dates = [(today - timedelta(days=i)) for i in range(6, -1, -1)]
-        for d in dates:
-            start = datetime.combine(d, datetime.min.time())
-            end = datetime.combine(d, datetime.max.time())
-            minutes_sum = db.session.query(db.func.coalesce(db.func.sum(Post.minutes), 0)).filter(
-                Post.user_id == current_user.id,
-                Post.created_at >= start,
-                Post.created_at <= end
-            ).scalar() or 0
-            recent_7_days.append({'date': d.strftime('%m-%d'), 'minutes': int(minutes_sum)})
-    else:
-        # not logged in, show zeros
-        today = datetime.utcnow().date()
-        dates = [(today - timedelta(days=i)) for i in range(6, -1, -1)]
-        for d in dates:
-            recent_7_days.append({'date': d.strftime('%m-%d'), 'minutes': 0})
+        summary = activity_summary(current_user.id, 365)
+    by_day = summary['by_day'] if summary else {}
+    # not logged in -> zeros
+    recent_7_days = [{'date': d.strftime('%m-%d'), 'minutes': by_day.get(d, (0, 0))[0]} for d in dates]
+    return render_template('stats.html', recent_7_days=recent_7_days, summary=summary,
+                           heatmap=heatmap_weeks(summary) if summary else [])
+
 
-    return render_template('stats.html', recent_7_days=recent_7_days)
+@app.route('/api/stats')
+@login_required
+def stats_api():
+    try:
+        days = max(1, min(int(request.args.get('days', 365)), STATS_MAX_DAYS))
+    except Exception:
+        days = 365
+    summary = activity_summary(current_user.id, days)
+    return jsonify({
+        'ok': True,
+        'start': summary['start'].isoformat(),
+        'end': summary['end'].isoformat(),
+        'total_minutes': summary['total_minutes'],
+        'active_days': summary['active_days'],
+        'days': [{'date': d.isoformat(), 'minutes': m, 'posts': n} for d, (m, n) in sorted(summary['by_day'].items())],
+        'sports': summary['sports'],
+    })
 
 
 @app.route('/friends')
@@ -802,19 +2291,14 @@ def checkin():
 
         # compute streak based on dates in Asia/Taipei (consecutive days)
         try:
-            local_tz = ZoneInfo('Asia/Taipei')
-            this_local_date = post_created_utc.replace(tzinfo=timezone.utc).astimezone(local_tz).date()
+            this_local_date = local_date_of(post_created_utc)
 
-            # fetch last previous post (before this one) - do this before adding the new post
-            last_post = Post.query.filter(Post.user_id == current_user.id).order_by(Post.created_at.desc()).first()
-            last_date = None
-            if last_post:
-                try:
-                    last_date = (last_post.created_at.replace(tzinfo=timezone.utc).astimezone(local_tz)).date()
-                except Exception:
-                    last_date = None
+            # latest previous post day (before this one) - do this before adding the new post
+            last_date = db.session.query(db.func.max(Post.local_date)).filter(Post.user_id == current_user.id).scalar()
+            if isinstance(last_date, str):
+                last_date = date.fromisoformat(last_date)
 
-            if last_post is None:
+            if last_date is None:
                 new_streak = 1
             else:
                 if last_date == this_local_date:
@@ -905,6 +2389,7 @@ def checkin():
             'image': image,
             'visibility': visibility,
             'created_at': post_created_utc,
+            'local_date': local_date_of(post_created_utc),
         }
         
         # Force insert the user if it doesn't exist using raw SQL to bypass ORM checks if needed
@@ -933,26 +2418,23 @@ def checkin():
 
         post = Post(**post_kwargs)
         db.session.add(post)
+        old_streak = current_user.streak_days or 0
         try:
             current_user.streak_days = new_streak
         except Exception:
             pass
+        db.session.flush()
+        fanout_post(post)
+        record_post_activity(post)
+        moved = bump_counters(post.user_id, post_count=1, total_minutes=int(post.minutes or 0))
+        moved['streak_days'] = (old_streak, current_user.streak_days or 0)
+        # streak / minutes badges and @mention notifications run in the outbox worker
+        enqueue_event('badge', user_id=current_user.id, event='checkin', changes=moved)
+        if message and '@' in message:
+            enqueue_event('mentions', message=message, actor_id=current_user.id, post_id=post.id)
+        invalidate_post_timelines(post)
         db.session.commit()
-        # run award checks for this user (streaks and cumulative minutes)
-        try:
-            run_award_checks_on_user(current_user.id)
-        except Exception:
-            pass
-        # notify mentioned users in the post message
-        try:
-            if message:
-                mentions = re.findall(r'@([A-Za-z0-9_\-]+)', message)
-                for uname in set(mentions):
-                    u = User.query.filter_by(username=uname).first()
-                    if u and u.id != current_user.id:
-                        create_notification(recipient_id=u.id, actor_id=current_user.id, verb='mention', post_id=post.id, data=message)
-        except Exception:
-            pass
+        note_minutes_change(post.user_id, post.local_date, int(post.minutes or 0))
         flash('已新增打卡貼文')
         return redirect(url_for('index'))
 
@@ -996,18 +2478,17 @@ def share_post():
     # create a new post that references the original
     newp = Post(user_id=current_user.id, sport=None, minutes=0, message=message or None, image=None, visibility='public', shared_from_id=orig.id)
     db.session.add(newp)
+    db.session.flush()
+    fanout_post(newp)
+    moved = bump_counters(current_user.id, post_count=1)
+    # a share counts as a post, so it can cross post_count thresholds
+    enqueue_event('badge', user_id=current_user.id, event='checkin', changes=moved)
+    # notify original post owner (outbox worker)
+    if orig.user_id and orig.user_id != current_user.id:
+        enqueue_event('notify', recipient_id=orig.user_id, actor_id=current_user.id, verb='share', post_id=orig.id, data=message,
+                      group_key=notification_group_key('share', orig.id))
+    invalidate_post_timelines(newp)
     db.session.commit()
-    # notify original post owner
-    try:
-        if orig.user_id and orig.user_id != current_user.id:
-            create_notification(recipient_id=orig.user_id, actor_id=current_user.id, verb='share', post_id=orig.id, data=message)
-    except Exception:
-        pass
-    # Award share does not currently affect badges, but we can run a generic check
-    try:
-        run_award_checks_on_user(current_user.id)
-    except Exception:
-        pass
     return jsonify({'ok': True, 'post_id': newp.id})
 
 
@@ -1017,17 +2498,12 @@ def user_page(username):
     if not u:
         flash('找不到使用者')
         return redirect(url_for('index'))
-    # show user's public posts
-    posts_q = Post.query.filter_by(user_id=u.id).order_by(Post.created_at.desc()).all()
+    # show the user's posts that the viewer is allowed to see
+    viewer_id = current_user.id if current_user.is_authenticated else None
+    posts_q = Post.query.filter(Post.user_id == u.id, visible_posts_filter(viewer_id)).order_by(Post.created_at.desc()).all()
     posts = []
     for p in posts_q:
-        try:
-            if getattr(p, 'image_blob', None):
-                image_url = url_for('post_image', post_id=p.id)
-            else:
-                image_url = p.image
-        except Exception:
-            image_url = p.image
+        image_url = post_image_url(p)
         posts.append({'id': p.id, 'sport': p.sport, 'minutes': p.minutes, 'message': p.message, 'image': image_url, 'created_at': to_local_str(p.created_at)})
     return render_template('user.html', user=u, posts=posts)
 
@@ -1051,15 +2527,17 @@ def friends_accept():
                 db.session.add(f2)
             db.session.add(f1)
             db.session.delete(invite)
+            moved = bump_counters(current_user.id, friend_count=1)
+            other_moved = {}
+            if other:
+                other_moved = bump_counters(other.id, friend_count=1)
+                # each side can now see the other's friends-only posts
+                link_timelines(current_user.id, other.id)
+                invalidate_feed(current_user.id, other.id)
+                enqueue_event('badge', user_id=other.id, event='friend_added', changes=other_moved)
+            # friend-count badges for both users (outbox worker)
+            enqueue_event('badge', user_id=current_user.id, event='friend_added', changes=moved)
             db.session.commit()
-            # award friend-count-based badges for both users
-            try:
-                other_user = User.query.filter_by(username=invite.from_user).first()
-                if other_user:
-                    run_award_checks_on_user(other_user.id)
-                run_award_checks_on_user(current_user.id)
-            except Exception:
-                pass
             return jsonify({'ok': True, 'friend': invite.from_user})
         except Exception:
             db.session.rollback()
@@ -1096,117 +2574,256 @@ def friends_invite():
     return jsonify({'ok': True})
 
 
-@app.route('/')
-@login_required
-def index():
-    # 以資料庫的貼文為主（沒有假資料）
-    posts_q = Post.query.order_by(Post.created_at.desc()).all()
-    posts = []
-    for p in posts_q:
-        # visibility: include post if public OR if it's friends-only and the current user is allowed
-        include = False
-        try:
-            vis = getattr(p, 'visibility', 'public')
-        except Exception:
-            vis = 'public'
-        if vis == 'public':
-            include = True
-        else:
-            # friends-only: include if current_user is author or current_user is friend with author
-            if current_user.is_authenticated and (current_user.id == p.user_id):
-                include = True
-            else:
-                # check Friend table for owner=current_user and friend_name=post author username
-                if current_user.is_authenticated:
-                    is_friend = Friend.query.filter_by(owner_id=current_user.id, friend_name=p.user.username).first()
-                    if is_friend:
-                        include = True
+# --- Timeline fan-out (materialized per-user feeds) ---
+FEED_FROM_TIMELINE = os.environ.get('FEED_FROM_TIMELINE', '1') == '1'
 
-        if not include:
-            continue
 
-        # determine if current user liked this post
-        liked_flag = False
-        if current_user.is_authenticated:
-            liked_flag = bool(Like.query.filter_by(user_id=current_user.id, post_id=p.id).first())
-
-        # build comment list with avatars if available
-        comments_list = []
-        for c in p.comments:
-            c_avatar = getattr(c, 'avatar', None)
-            if not c_avatar:
-                # try to resolve by username
-                u_c = User.query.filter_by(username=c.user).first()
-                if u_c:
-                    if getattr(u_c, 'avatar_blob', None):
-                        try:
-                            c_avatar = url_for('user_avatar', user_id=u_c.id)
-                        except Exception:
-                            c_avatar = u_c.avatar
-                    else:
-                        c_avatar = u_c.avatar
-            comments_list.append({'user': c.user, 'avatar': c_avatar, 'text': c.text, 'time': to_local_str(c.time)})
-
-        # convert mentions (@username) in message to links
-        msg_html = None
-        if p.message:
-            def repl_mention(m):
-                uname = m.group(1)
-                return f'<a href="{url_for("user_page", username=uname)}">@{uname}</a>'
-            msg_html = re.sub(r'@([A-Za-z0-9_\-]+)', repl_mention, p.message)
-
-        # include shared original post if present
-        original = None
-        if getattr(p, 'shared_from_id', None):
-            orig = Post.query.get(p.shared_from_id)
-            if orig:
-                original = {
-                    'id': orig.id,
-                    'user': orig.user.display_name or orig.user.username,
-                    'avatar': (url_for('user_avatar', user_id=orig.user.id) if getattr(orig.user, 'avatar_blob', None) else orig.user.avatar),
-                    'sport': orig.sport,
-                    'minutes': orig.minutes,
-                    'message': orig.message,
-                    'image': orig.image
-                }
-        # fetch the user's pinned badges (up to 3) if any
-        pinned_badges = []
-        try:
-            ubps = UserBadge.query.filter_by(user_id=p.user.id, pinned=True).order_by(UserBadge.earned_at.asc()).limit(3).all()
-            for ubp in ubps:
-                try:
-                    bimg = ubp.badge.image_filename
-                    if bimg:
-                        pinned_badges.append(url_for('static', filename=f'badges/{bimg}'))
-                except Exception:
-                    continue
-        except Exception:
-            pinned_badges = []
+def friends_audience(user_id):
+    """The user and everyone who has them as a friend, i.e. who sees their friends-only posts."""
+    followers = db.session.query(Friend.owner_id).join(User, User.username == Friend.friend_name).filter(User.id == user_id).distinct().all()
+    return sorted({user_id} | {r[0] for r in followers})
 
-        # compute avatar and image urls (prefer DB blobs when present)
-        try:
-            # 如果 p.user 存在且有 avatar_blob，從 DB blob 產生 URL
-            if p.user and getattr(p.user, 'avatar_blob', None):
-                avatar_url = url_for('user_avatar', user_id=p.user.id)
-            else:
-                # 如果 p.user 存在就取他的 avatar 屬性，否則使用預設頭像
-                if p.user:
-                    avatar_url = p.user.avatar
-                else:
-                    avatar_url = "https://ui-avatars.com/api/?name=Unknown"
-        except Exception:
-            # 發生任何例外時也不要崩潰，改用預設頭像
-            avatar_url = "https://ui-avatars.com/api/?name=Unknown"
 
-        try:
-            if getattr(p, 'image_blob', None):
-                image_url = url_for('post_image', post_id=p.id)
-            else:
-                image_url = p.image
-        except Exception:
-            image_url = p.image
+def _timeline_recipients(post):
+    """Timeline owner ids that should receive a post, resolved from its visibility."""
+    if (post.visibility or 'public') == 'public':
+        return [PUBLIC_TIMELINE_ID]
+    return friends_audience(post.user_id)
+
+
+def fanout_post(post):
+    """Write timeline rows for a (flushed) post. The caller commits."""
+    rows = [{'owner_id': oid, 'post_id': post.id, 'author_id': post.user_id, 'created_at': post.created_at}
+            for oid in _timeline_recipients(post)]
+    if rows:
+        db.session.execute(db.insert(TimelineEntry), rows)
+
+
+def refanout_post(post):
+    """Rewrite a post's timeline rows after its visibility or time changed. The caller commits."""
+    TimelineEntry.query.filter_by(post_id=post.id).delete(synchronize_session=False)
+    fanout_post(post)
+
+
+def link_timelines(user_a_id, user_b_id):
+    """After a friendship is created, copy each side's friends-only posts into the other's timeline."""
+    for owner_id, author_id in ((user_a_id, user_b_id), (user_b_id, user_a_id)):
+        already = db.select(TimelineEntry.id).where(TimelineEntry.owner_id == owner_id, TimelineEntry.post_id == Post.id).exists()
+        sel = db.select(db.literal(owner_id), Post.id, Post.user_id, Post.created_at).where(
+            Post.user_id == author_id, Post.visibility == 'friends', ~already
+        )
+        db.session.execute(db.insert(TimelineEntry).from_select(['owner_id', 'post_id', 'author_id', 'created_at'], sel))
+
+
+def unlink_timelines(user_id):
+    """Drop a user's own timeline and every timeline row pointing at their posts (account removal)."""
+    TimelineEntry.query.filter(or_(TimelineEntry.owner_id == user_id, TimelineEntry.author_id == user_id)).delete(synchronize_session=False)
+
 
-        posts.append({
+def rebuild_timelines():
+    """Recompute every timeline from post/friend with set-based INSERT ... SELECT statements.
+    Returns the number of rows written."""
+    cols = ['owner_id', 'post_id', 'author_id', 'created_at']
+    is_public = or_(Post.visibility == 'public', Post.visibility.is_(None))
+    TimelineEntry.query.delete(synchronize_session=False)
+    # public posts -> shared timeline
+    db.session.execute(db.insert(TimelineEntry).from_select(cols, db.select(
+        db.literal(PUBLIC_TIMELINE_ID), Post.id, Post.user_id, Post.created_at).where(is_public)))
+    # friends-only posts -> author
+    db.session.execute(db.insert(TimelineEntry).from_select(cols, db.select(
+        Post.user_id, Post.id, Post.user_id, Post.created_at).where(~is_public)))
+    # friends-only posts -> everyone who has the author as a friend
+    db.session.execute(db.insert(TimelineEntry).from_select(cols, db.select(
+        Friend.owner_id, Post.id, Post.user_id, Post.created_at).distinct()
+        .select_from(Post).join(User, User.id == Post.user_id).join(Friend, Friend.friend_name == User.username)
+        .where(~is_public, Friend.owner_id != Post.user_id)))
+    total = db.session.query(db.func.count(TimelineEntry.id)).scalar() or 0
+    db.session.commit()
+    return total
+
+
+timeline_cli = AppGroup('timeline', help='Materialized feed timelines.')
+
+
+@timeline_cli.command('backfill')
+def timeline_backfill_command():
+    """Rebuild all timelines from existing posts and friendships."""
+    total = rebuild_timelines()
+    click.echo(f'timeline rows written: {total}')
+
+
+app.cli.add_command(timeline_cli)
+
+
+# --- Home feed helpers (keyset pagination) ---
+FEED_PAGE_SIZE = int(os.environ.get('FEED_PAGE_SIZE', '20'))
+
+
+def encode_feed_cursor(created_at, post_id):
+    """Encode a (created_at, id) keyset position as an opaque url-safe token."""
+    raw = f"{created_at.isoformat()}|{post_id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_feed_cursor(token):
+    """Decode a cursor produced by encode_feed_cursor. Returns (created_at, id) or raises ValueError."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8')
+        ts, pid = raw.rsplit('|', 1)
+        return datetime.fromisoformat(ts), int(pid)
+    except Exception:
+        raise ValueError('invalid cursor')
+
+
+def friend_ids_subquery(viewer_id):
+    """SELECT of the user ids the viewer has as friends (Friend rows store the friend's username)."""
+    return db.select(User.id).join(Friend, Friend.friend_name == User.username).where(Friend.owner_id == viewer_id)
+
+
+def visible_posts_filter(viewer_id):
+    """WHERE clause for posts a viewer may see: public posts, their own posts and
+    friends-only posts whose author is in the viewer's friend set (semi-join, so the
+    database never hands back rows that would be thrown away)."""
+    public = or_(Post.visibility == 'public', Post.visibility.is_(None))
+    if not viewer_id:
+        return public
+    return or_(public, Post.user_id == viewer_id, Post.user_id.in_(friend_ids_subquery(viewer_id)))
+
+
+def fetch_feed_page(cursor=None, limit=None):
+    """Load one page of posts visible to current_user, newest first.
+
+    Visibility is part of the WHERE clause so a page is never short because of
+    filtered rows. Returns (posts, next_cursor); next_cursor is None on the last page.
+    """
+    limit = limit or FEED_PAGE_SIZE
+    viewer_id = current_user.id if current_user.is_authenticated else None
+    if FEED_FROM_TIMELINE:
+        # range scan over the viewer's materialized timeline plus the shared public one
+        owners = [PUBLIC_TIMELINE_ID] + ([viewer_id] if viewer_id else [])
+        q = Post.query.join(TimelineEntry, TimelineEntry.post_id == Post.id).options(db.joinedload(Post.user)).filter(TimelineEntry.owner_id.in_(owners))
+        order_time, order_id = TimelineEntry.created_at, TimelineEntry.post_id
+    else:
+        q = Post.query.options(db.joinedload(Post.user)).filter(visible_posts_filter(viewer_id))
+        order_time, order_id = Post.created_at, Post.id
+    if cursor:
+        c_time, c_id = cursor
+        q = q.filter(or_(order_time < c_time, and_(order_time == c_time, order_id < c_id)))
+    # fetch one extra row to know whether another page exists
+    rows = q.order_by(order_time.desc(), order_id.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_feed_cursor(last.created_at, last.id)
+    return rows, next_cursor
+
+
+FEED_COMMENTS = int(os.environ.get('FEED_COMMENTS', '3'))
+COMMENTS_PAGE_SIZE = int(os.environ.get('COMMENTS_PAGE_SIZE', '20'))
+
+
+def serialize_comments(rows):
+    """Template/JSON dicts for Comment rows. Authors are loaded by user_id in one query, so names
+    and avatars follow profile changes; comments without a resolvable author keep the stored
+    name and avatar."""
+    author_ids = {c.user_id for c in rows if c.user_id}
+    authors = {}
+    if author_ids:
+        for u in User.query.filter(User.id.in_(author_ids)).all():
+            authors[u.id] = u
+    out = []
+    for c in rows:
+        author = authors.get(c.user_id)
+        name, avatar = c.user, c.avatar
+        if author:
+            name, avatar = author.display_name or author.username, avatar_url_for(author) or c.avatar
+        out.append({'user': name, 'avatar': avatar, 'text': c.text, 'time': to_local_str(c.time)})
+    return out
+
+
+def assemble_feed_posts(posts):
+    """Build the template/JSON representation of a page of feed posts.
+
+    Everything the page needs besides the posts themselves (viewer likes, comments and
+    their authors, shared originals, pinned badges) is fetched with one bulk query per
+    kind, so the query count does not grow with the page size.
+    """
+    if not posts:
+        return []
+    post_ids = [p.id for p in posts]
+    author_ids = {p.user_id for p in posts}
+
+    # posts the viewer liked on this page
+    liked_ids = set()
+    if current_user.is_authenticated:
+        liked_ids = {r[0] for r in db.session.query(Like.post_id).filter(Like.user_id == current_user.id, Like.post_id.in_(post_ids)).all()}
+
+    # latest FEED_COMMENTS comments of every post on the page in one windowed query (oldest first);
+    # older ones load from /post/<id>/comments
+    ranked = db.select(Comment.id, db.func.row_number().over(
+        partition_by=Comment.post_id, order_by=(Comment.time.desc(), Comment.id.desc())).label('rn')).where(
+        Comment.post_id.in_(post_ids)).subquery()
+    comment_rows = Comment.query.join(ranked, ranked.c.id == Comment.id).filter(ranked.c.rn <= FEED_COMMENTS).order_by(
+        Comment.post_id, Comment.time.asc(), Comment.id.asc()).all()
+    comment_dicts = serialize_comments(comment_rows)
+    comments_by_post = {}
+    for c, d in zip(comment_rows, comment_dicts):
+        comments_by_post.setdefault(c.post_id, []).append((c, d))
+
+    # shared originals with their authors
+    originals = {}
+    orig_ids = {p.shared_from_id for p in posts if p.shared_from_id}
+    if orig_ids:
+        viewer_id = current_user.id if current_user.is_authenticated else None
+        # originals the viewer is not allowed to see are not loaded at all
+        for o in Post.query.options(db.joinedload(Post.user)).filter(Post.id.in_(orig_ids), visible_posts_filter(viewer_id)).all():
+            originals[o.id] = o
+
+    # pinned badges (max 3 per author, oldest first)
+    pinned_by_user = {}
+    pinned_rows = db.session.query(UserBadge.user_id, Badge.image_filename).join(Badge, Badge.id == UserBadge.badge_id).filter(
+        UserBadge.user_id.in_(author_ids), UserBadge.pinned.is_(True)
+    ).order_by(UserBadge.user_id, UserBadge.earned_at.asc()).all()
+    for uid, bimg in pinned_rows:
+        lst = pinned_by_user.setdefault(uid, [])
+        if bimg and len(lst) < 3:
+            lst.append(url_for('static', filename=f'badges/{bimg}'))
+
+    # convert mentions (@username) in message to links
+    def repl_mention(m):
+        uname = m.group(1)
+        return f'<a href="{url_for("user_page", username=uname)}">@{uname}</a>'
+
+    out = []
+    for p in posts:
+        shown = comments_by_post.get(p.id, [])
+        comments_list = [d for _, d in shown]
+        comment_count = max(p.comment_count or 0, len(shown))
+        comments_cursor = None
+        if comment_count > len(shown) and shown and shown[0][0].time:
+            comments_cursor = encode_feed_cursor(shown[0][0].time, shown[0][0].id)
+
+        msg_html = re.sub(r'@([A-Za-z0-9_\-]+)', repl_mention, p.message) if p.message else None
+
+        original = None
+        orig = originals.get(p.shared_from_id) if p.shared_from_id else None
+        if orig:
+            original = {
+                'id': orig.id,
+                'user': (orig.user.display_name or orig.user.username) if orig.user else "未知使用者",
+                'avatar': avatar_url_for(orig.user),
+                'sport': orig.sport,
+                'minutes': orig.minutes,
+                'message': orig.message,
+                'image': orig.image
+            }
+
+        # 如果 p.user 存在就用他的頭像，否則使用預設頭像
+        avatar_url = avatar_url_for(p.user) if p.user else "https://ui-avatars.com/api/?name=Unknown"
+
+        out.append({
             'id': p.id,
             # 如果 p.user 存在就顯示 display_name 或 username，否則使用 "未知使用者"
             'user': (p.user.display_name or p.user.username) if p.user else "未知使用者",
@@ -1216,24 +2833,219 @@ def index():
             'minutes': p.minutes,
             'message': p.message,
             'message_html': msg_html,
-            'image': image_url,
-            'pinned_badges': pinned_badges,
+            'image': post_image_url(p),
+            'pinned_badges': pinned_by_user.get(p.user_id, []),
             'created_at': to_local_str(p.created_at),
             'likes': p.likes,
-            'liked': liked_flag,
+            'liked': p.id in liked_ids,
             'comments': comments_list,
+            'comment_count': comment_count,
+            'comments_cursor': comments_cursor,
             'original': original,
-            'visibility': vis
+            'visibility': getattr(p, 'visibility', None) or 'public'
         })
-    # 未讀通知數
-    unread_count = 0
-    if current_user.is_authenticated:
+    return out
+
+
+@app.route('/post/<int:post_id>/comments')
+def post_comments(post_id):
+    """Older comments of a post, newest first, starting after ?cursor= (the feed's comments_cursor
+    or a previous next_cursor). Returns {comments, next_cursor}."""
+    viewer_id = current_user.id if current_user.is_authenticated else None
+    if db.session.query(Post.id).filter(Post.id == post_id, visible_posts_filter(viewer_id)).first() is None:
+        return jsonify({'ok': False}), 404
+    q = Comment.query.filter(Comment.post_id == post_id)
+    token = request.args.get('cursor')
+    if token:
         try:
-            unread_count = Notification.query.filter_by(user_id=current_user.id, read=False).count()
-        except Exception:
-            unread_count = 0
+            c_time, c_id = decode_feed_cursor(token)
+        except ValueError:
+            return jsonify({'ok': False, 'error': 'invalid cursor'}), 400
+        q = q.filter(or_(Comment.time < c_time, and_(Comment.time == c_time, Comment.id < c_id)))
+    rows = q.order_by(Comment.time.desc(), Comment.id.desc()).limit(COMMENTS_PAGE_SIZE + 1).all()
+    next_cursor = None
+    if len(rows) > COMMENTS_PAGE_SIZE:
+        rows = rows[:COMMENTS_PAGE_SIZE]
+        next_cursor = encode_feed_cursor(rows[-1].time, rows[-1].id)
+    return jsonify({'ok': True, 'comments': serialize_comments(rows), 'next_cursor': next_cursor})
+
+
+# --- Feed page cache ---
+FEED_CACHE_SIZE = int(os.environ.get('FEED_CACHE_SIZE', '512'))
+FEED_CACHE_TTL = float(os.environ.get('FEED_CACHE_TTL', '30'))
+FEED_VERSION_GLOBAL = 'feed'  # rare site-wide changes: profiles, pinned badges, account removal
+FEED_VERSION_PUBLIC = 'feed:public'  # the set of public posts
+
+
+def dialect_insert(model):
+    """INSERT for the current database dialect, so callers can use on_conflict_do_update/nothing
+    on both Postgres and SQLite."""
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as pg_insert
+        return pg_insert(model)
+    from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+    return sqlite_insert(model)
+
+
+def bump_cache_versions(names):
+    """Increment shared version counters inside the current transaction (the caller commits)."""
+    names = sorted(set(names))
+    if not names:
+        return
+    stmt = dialect_insert(CacheVersion).values([{'name': n, 'version': 1} for n in names])
+    stmt = stmt.on_conflict_do_update(index_elements=['name'], set_={'version': CacheVersion.version + 1})
+    db.session.execute(stmt)
+
+
+def feed_version_name(user_id):
+    return f'feed:user:{user_id}'
+
+
+def invalidate_feed(*user_ids):
+    """Invalidate cached feed pages. With user ids only those viewers' pages are dropped
+    (e.g. friendship changes); without, every viewer's pages are (profile changes). Changes to a
+    post's likes, comments or text move its cache_version instead."""
+    if user_ids:
+        bump_cache_versions([feed_version_name(uid) for uid in user_ids if uid])
+    else:
+        bump_cache_versions([FEED_VERSION_GLOBAL])
+
+
+def invalidate_post_timelines(post, moved=False):
+    """Drop the cached pages whose list of posts changes when `post` is added or removed: every
+    page for a public post, otherwise only its audience's. moved=True (visibility or time edited)
+    drops both, since the post may have left one for the other."""
+    public = (post.visibility or 'public') == 'public'
+    if public or moved:
+        bump_cache_versions([FEED_VERSION_PUBLIC])
+    if not public or moved:
+        invalidate_feed(*friends_audience(post.user_id))
+
+
+def post_cache_stamps(post_ids):
+    """{post_id: cache_version} for the posts that still exist, read by primary key."""
+    if not post_ids:
+        return {}
+    return dict(db.session.query(Post.id, Post.cache_version).filter(Post.id.in_(sorted(post_ids))).all())
+
+
+class FeedPageCache:
+    """Per-process LRU of assembled feed pages with a TTL. Entries are keyed by the shared
+    version counters, so a bump from any worker makes older entries unreachable."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stale = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < now:
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def discard(self, key):
+        """Drop an entry the caller found out of date after get(); it counts as a miss."""
+        with self._lock:
+            self._data.pop(key, None)
+            self.hits -= 1
+            self.misses += 1
+            self.stale += 1
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {'size': len(self._data), 'maxsize': self.maxsize, 'ttl': self.ttl, 'hits': self.hits,
+                    'misses': self.misses, 'evictions': self.evictions, 'stale': self.stale, 'hit_rate': (self.hits / total) if total else 0.0}
+
+
+feed_cache = FeedPageCache(FEED_CACHE_SIZE, FEED_CACHE_TTL)
+
+
+def get_feed_page(cursor_token=None):
+    """Assembled feed page for current_user, served from feed_cache when the shared versions
+    still match: the page's key holds the versions of its post list (global, public and the
+    viewer's own) and the entry the cache_version of each post it shows, checked with one primary
+    key lookup. Returns (posts, next_cursor); raises ValueError on a bad cursor."""
+    cursor = decode_feed_cursor(cursor_token) if cursor_token else None
+    viewer_id = current_user.id if current_user.is_authenticated else None
+    if FEED_CACHE_SIZE <= 0:
+        page, next_cursor = fetch_feed_page(cursor)
+        return merge_pending_likes(assemble_feed_posts(page)), next_cursor
+    names = [FEED_VERSION_GLOBAL, FEED_VERSION_PUBLIC] + ([feed_version_name(viewer_id)] if viewer_id else [])
+    versions = dict(db.session.query(CacheVersion.name, CacheVersion.version).filter(CacheVersion.name.in_(names)).all())
+    key = (viewer_id, cursor_token or '', FEED_PAGE_SIZE) + tuple(versions.get(n, 0) for n in names)
+    cached = feed_cache.get(key)
+    if cached is not None and post_cache_stamps(cached[2]) != cached[2]:
+        # a post on the page (or a shared original) was liked, commented, edited or deleted
+        feed_cache.discard(key)
+        cached = None
+    if cached is None:
+        page, next_cursor = fetch_feed_page(cursor)
+        # stamps come from the rows being assembled (originals are read before assembly), so a
+        # concurrent write can only make the entry look stale, never hide behind a fresh stamp
+        stamps = {p.id: p.cache_version for p in page}
+        stamps.update(post_cache_stamps({p.shared_from_id for p in page if p.shared_from_id} - set(stamps)))
+        cached = (assemble_feed_posts(page), next_cursor, stamps)
+        feed_cache.put(key, cached)
+    # cached pages hold stored counts; unflushed like deltas are added per request
+    return merge_pending_likes(cached[0]), cached[1]
+
+
+@app.route('/admin/feed_cache')
+@login_required
+def admin_feed_cache():
+    if not is_admin_user():
+        return jsonify({'ok': False}), 403
+    return jsonify({'ok': True, 'feed_cache': feed_cache.stats()})
+
+
+@app.route('/')
+@login_required
+def index():
+    # 以資料庫的貼文為主（沒有假資料），只載入第一頁，其餘由 /feed 接續載入
+    posts, next_cursor = get_feed_page()
+    # 未讀通知數（user_counters，load_user 已一併載入）
+    unread_count = current_user.counters.unread_notifications if current_user.counters else 0
     # 傳遞目前使用者狀態給模板
-    return render_template('index.html', status=current_user, posts=posts, unread_count=unread_count)
+    return render_template('index.html', status=current_user, posts=posts, unread_count=unread_count, next_cursor=next_cursor)
+
+
+@app.route('/feed')
+@login_required
+def feed_page():
+    """Next page of the home feed ("load more"). Returns JSON by default or an HTML fragment with ?format=html."""
+    try:
+        posts, next_cursor = get_feed_page(request.args.get('cursor'))
+    except ValueError:
+        return jsonify({'ok': False, 'error': 'invalid cursor'}), 400
+    if request.args.get('format') == 'html':
+        resp = Response(render_template('_posts.html', posts=posts), mimetype='text/html')
+        resp.headers['X-Next-Cursor'] = next_cursor or ''
+        return resp
+    return jsonify({'ok': True, 'posts': posts, 'next_cursor': next_cursor})
 
 
 @app.route('/profile', methods=['GET', 'POST'])
@@ -1243,13 +3055,7 @@ def profile_page():
     user_posts = Post.query.filter_by(user_id=current_user.id).order_by(Post.created_at.desc()).all()
     p_list = []
     for p in user_posts:
-        try:
-            if getattr(p, 'image_blob', None):
-                image_url = url_for('post_image', post_id=p.id)
-            else:
-                image_url = p.image
-        except Exception:
-            image_url = p.image
+        image_url = post_image_url(p)
         p_list.append({'id': p.id, 'sport': p.sport, 'minutes': p.minutes, 'message': p.message, 'image': image_url, 'created_at': to_local_str(p.created_at)})
     # fetch user's earned badges
     earned = []
@@ -1304,7 +3110,11 @@ def edit_post(post_id):
             else:
                 p.image = save_uploaded_file(file)
 
+        # retract the old contribution to the daily rollup; re-applied below with the new values
+        old_minutes, old_day = int(p.minutes or 0), p.local_date or local_date_of(p.created_at)
+        record_post_activity(p, -1)
         # parse date/time fields (assume Asia/Taipei local)
+        old_created_at = p.created_at
         date_str = request.form.get('date')
         time_str = request.form.get('time')
         if date_str and time_str:
@@ -1314,14 +3124,29 @@ def edit_post(post_id):
                 utc_dt = local_dt.astimezone(timezone.utc)
                 # store naive UTC
                 p.created_at = utc_dt.replace(tzinfo=None)
+                p.local_date = local_date_of(p.created_at)
             except Exception:
                 pass
 
+        timeline_changed = (p.visibility or 'public') != visibility
         p.sport = sport or None
         p.minutes = minutes
         p.message = message or None
         p.visibility = visibility
+        moved_in_feed = timeline_changed or p.created_at != old_created_at
+        if moved_in_feed:
+            refanout_post(p)
+            invalidate_post_timelines(p, moved=True)
+        p.cache_version = Post.cache_version + 1
+        record_post_activity(p)
+        if not p.shared_from_id:
+            moved = bump_counters(p.user_id, total_minutes=int(p.minutes or 0) - old_minutes)
+            # later events only check the range they move, so a threshold crossed here is checked now
+            enqueue_event('badge', user_id=p.user_id, event='checkin', changes=moved)
         db.session.commit()
+        if not p.shared_from_id:
+            note_minutes_change(p.user_id, old_day, -old_minutes)
+            note_minutes_change(p.user_id, p.local_date, int(p.minutes or 0))
         flash('已更新貼文')
         return redirect(url_for('profile_page'))
 
@@ -1354,12 +3179,24 @@ def delete_post(post_id):
     try:
         # delete related comments and likes
         # delete comments and likes associated with the post
-        Comment.query.filter_by(post_id=p.id).delete()
-        Like.query.filter_by(post_id=p.id).delete()
+        removed_comments = Comment.query.filter_by(post_id=p.id).delete()
+        removed_likes = Like.query.filter_by(post_id=p.id).delete()
         # delete notifications that reference this post to avoid FK constraint
+        bump_counters_many('unread_notifications', unread_deltas_for(Notification.post_id == p.id))
+        NotificationActor.query.filter(NotificationActor.notification_id.in_(
+            db.select(Notification.id).where(Notification.post_id == p.id))).delete(synchronize_session=False)
         Notification.query.filter_by(post_id=p.id).delete()
+        TimelineEntry.query.filter_by(post_id=p.id).delete()
+        record_post_activity(p, -1)
+        bump_counters(p.user_id, post_count=-1, total_minutes=0 if p.shared_from_id else -int(p.minutes or 0),
+                      likes_received=-removed_likes, comments_received=-removed_comments)
+        removed = (p.user_id, p.local_date or local_date_of(p.created_at), -int(p.minutes or 0)) if not p.shared_from_id else None
+        # pages sharing it see the original's row disappear (get_feed_page's post stamps)
+        invalidate_post_timelines(p)
         db.session.delete(p)
         db.session.commit()
+        if removed:
+            note_minutes_change(*removed)
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest' or request.is_json:
             return jsonify({'ok': True})
         flash('貼文已刪除')
@@ -1405,20 +3242,55 @@ def delete_account():
                 Comment.query.filter(Comment.post_id.in_(post_ids)).delete(synchronize_session=False)
                 Like.query.filter(Like.post_id.in_(post_ids)).delete(synchronize_session=False)
                 db.session.commit()
-        # Then delete the user's own comments and likes (authored by the user)
+        # Then delete the user's own comments and likes (authored by the user), taking them off
+        # the other authors' counters (and like totals) first
+        liked = db.session.query(Post.id, Post.user_id, db.func.count(Like.id)).join(Like, Like.post_id == Post.id).filter(
+            Like.user_id == uid).group_by(Post.id, Post.user_id).all()
+        if liked:
+            db.session.execute(text('UPDATE post SET likes = likes - :d, cache_version = cache_version + 1 WHERE id = :pid'), [{'pid': pid, 'd': n} for pid, _, n in liked])
+            likes_by_owner = {}
+            for _, owner_id, n in liked:
+                likes_by_owner[owner_id] = likes_by_owner.get(owner_id, 0) - n
+            bump_counters_many('likes_received', likes_by_owner)
+        commented = db.session.query(Post.id, Post.user_id, db.func.count(Comment.id)).join(Comment, Comment.post_id == Post.id).filter(
+            Comment.user_id == uid).group_by(Post.id, Post.user_id).all()
+        if commented:
+            db.session.execute(text('UPDATE post SET comment_count = comment_count - :d, cache_version = cache_version + 1 WHERE id = :pid'), [{'pid': pid, 'd': n} for pid, _, n in commented])
+            comments_by_owner = {}
+            for _, owner_id, n in commented:
+                comments_by_owner[owner_id] = comments_by_owner.get(owner_id, 0) - n
+            bump_counters_many('comments_received', comments_by_owner)
         Comment.query.filter_by(user_id=uid).delete()
         Like.query.filter_by(user_id=uid).delete()
+        # drop the user's timeline and timeline rows for the user's posts (friends lose access too)
+        unlink_timelines(uid)
+        UserDailyMinutes.query.filter_by(user_id=uid).delete()
+        # frozen weeks keep the other users' ranks; this user's entries go with the account
+        LeaderboardSnapshot.query.filter_by(user_id=uid).delete()
         # Now delete the user's posts
         Post.query.filter_by(user_id=uid).delete()
         # delete friend relations owned by user and references to user's username
         Friend.query.filter_by(owner_id=uid).delete()
+        friend_owners = db.session.query(Friend.owner_id, db.func.count(Friend.id)).filter(Friend.friend_name == uname).group_by(Friend.owner_id).all()
+        bump_counters_many('friend_count', {owner_id: -n for owner_id, n in friend_owners})
         Friend.query.filter(Friend.friend_name == uname).delete()
+        UserCounters.query.filter_by(user_id=uid).delete()
         # pending invites involving this user
         PendingInvite.query.filter(or_(PendingInvite.from_user == uname, PendingInvite.to_user == uname)).delete()
         # notifications where user is recipient or actor
+        bump_counters_many('unread_notifications', unread_deltas_for(Notification.actor_id == uid, Notification.user_id != uid))
+        # grouped rows that stay (someone else is the latest actor) stop counting this user
+        db.session.execute(db.update(Notification).where(
+            Notification.id.in_(db.select(NotificationActor.notification_id).where(NotificationActor.actor_id == uid)),
+            Notification.user_id != uid, Notification.actor_id != uid, Notification.actor_count > 1,
+        ).values(actor_count=Notification.actor_count - 1), execution_options={'synchronize_session': False})
+        gone = db.select(Notification.id).where(or_(Notification.user_id == uid, Notification.actor_id == uid))
+        NotificationActor.query.filter(or_(NotificationActor.notification_id.in_(gone), NotificationActor.actor_id == uid)).delete(
+            synchronize_session=False)
         Notification.query.filter(or_(Notification.user_id == uid, Notification.actor_id == uid)).delete()
         # finally delete user row
         User.query.filter_by(id=uid).delete()
+        invalidate_feed()
         db.session.commit()
     except Exception:
         db.session.rollback()
@@ -1429,24 +3301,79 @@ def delete_account():
     return redirect(url_for('register'))
 
 
+# --- Notifications page (keyset pagination, same cursor format as the feed) ---
+NOTIFICATIONS_PAGE_SIZE = int(os.environ.get('NOTIFICATIONS_PAGE_SIZE', '30'))
+
+
+def fetch_notifications_page(user_id, cursor=None, limit=None):
+    """One page of a user's notifications, newest first (range scan on (user_id, created_at)).
+    Returns (notifications, next_cursor); next_cursor is None on the last page."""
+    limit = limit or NOTIFICATIONS_PAGE_SIZE
+    q = Notification.query.filter(Notification.user_id == user_id)
+    if cursor:
+        c_time, c_id = cursor
+        q = q.filter(or_(Notification.created_at < c_time, and_(Notification.created_at == c_time, Notification.id < c_id)))
+    rows = q.order_by(Notification.created_at.desc(), Notification.id.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_feed_cursor(rows[-1].created_at, rows[-1].id)
+    return rows, next_cursor
+
+
+def assemble_notifications(notes):
+    """Template/JSON representation of a page of notifications. Actors (grouped rows name up to
+    NOTIFY_RECENT_ACTORS) and posts are loaded in one query each, with only the columns shown."""
+    recent_by_note = {n.id: (json.loads(n.recent_actors) if n.recent_actors else [n.actor_id]) for n in notes}
+    actor_ids = {a for ids in recent_by_note.values() for a in ids if a}
+    post_ids = {n.post_id for n in notes if n.post_id}
+    actors, posts = {}, {}
+    if actor_ids:
+        cols = [User.id, User.username, User.display_name, User.avatar]
+        if hasattr(User, 'has_avatar_blob'):
+            cols.append(User.has_avatar_blob)
+        actors = {u.id: u for u in db.session.query(*cols).filter(User.id.in_(actor_ids)).all()}
+    if post_ids:
+        posts = {row.id: row for row in db.session.query(Post.id, Post.sport, Post.message).filter(Post.id.in_(post_ids)).all()}
+    out = []
+    for n in notes:
+        recent = [actors[a] for a in recent_by_note[n.id] if a in actors]
+        names = [u.display_name or u.username for u in recent]
+        post = posts.get(n.post_id)
+        out.append({'id': n.id, 'verb': n.verb, 'actor': names[0] if names else None, 'actor_avatar': avatar_url_for(recent[0]) if recent else None,
+                    'actors': names, 'others': max((n.actor_count or 1) - len(names), 0), 'actor_count': n.actor_count or 1,
+                    'post_id': post.id if post else None, 'post_preview': ((post.message or post.sport or '')[:40]) if post else None,
+                    'comment_id': n.comment_id, 'data': n.data, 'created_at': to_local_str(n.created_at), 'read': bool(n.read)})
+    return out
+
+
+def notifications_for_request():
+    """(notifications, next_cursor) for current_user and the request's ?cursor; raises ValueError on a bad cursor."""
+    token = request.args.get('cursor')
+    cursor = decode_feed_cursor(token) if token else None
+    notes, next_cursor = fetch_notifications_page(current_user.id, cursor)
+    return assemble_notifications(notes), next_cursor
+
+
 @app.route('/notifications')
 @login_required
 def notifications_page():
-    notes = Notification.query.filter_by(user_id=current_user.id).order_by(Notification.created_at.desc()).all()
-    # build display info
-    out = []
-    for n in notes:
-        actor = User.query.get(n.actor_id) if n.actor_id else None
-        post = Post.query.get(n.post_id) if n.post_id else None
-        try:
-            if actor and getattr(actor, 'avatar_blob', None):
-                actor_avatar = url_for('user_avatar', user_id=actor.id)
-            else:
-                actor_avatar = actor.avatar if actor else None
-        except Exception:
-            actor_avatar = actor.avatar if actor else None
-        out.append({'id': n.id, 'verb': n.verb, 'actor': (actor.display_name or actor.username) if actor else None, 'actor_avatar': actor_avatar, 'post_id': n.post_id, 'comment_id': n.comment_id, 'data': n.data, 'created_at': to_local_str(n.created_at), 'read': n.read})
-    return render_template('notifications.html', notifications=out)
+    try:
+        out, next_cursor = notifications_for_request()
+    except ValueError:
+        return redirect(url_for('notifications_page'))
+    return render_template('notifications.html', notifications=out, next_cursor=next_cursor)
+
+
+@app.route('/api/notifications')
+@login_required
+def api_notifications():
+    """Next page of notifications for incremental loading: ?cursor=<next_cursor from the previous page>."""
+    try:
+        out, next_cursor = notifications_for_request()
+    except ValueError:
+        return jsonify({'ok': False, 'error': 'invalid cursor'}), 400
+    return jsonify({'ok': True, 'notifications': out, 'next_cursor': next_cursor})
 
 
 @app.route('/settings', methods=['GET', 'POST'])
@@ -1485,6 +3412,8 @@ def settings_page():
             else:
                 current_user.avatar = save_uploaded_file(file)
 
+        # name/avatar are shown on every cached feed page
+        invalidate_feed()
         db.session.commit()
         flash('個人設定已更新')
         return redirect(url_for('settings_page'))
@@ -1515,6 +3444,8 @@ def badge_pin():
         return jsonify({'ok': False, 'error': 'max pinned (3) reached'}), 400
     try:
         ub.pinned = True
+        # pinned badges are shown next to the user's name on cached feed pages
+        invalidate_feed()
         db.session.commit()
         return jsonify({'ok': True})
     except Exception:
@@ -1537,6 +3468,7 @@ def badge_unpin():
         return jsonify({'ok': False, 'error': 'not earned'}), 403
     try:
         ub.pinned = False
+        invalidate_feed()
         db.session.commit()
         return jsonify({'ok': True})
     except Exception:
@@ -1567,21 +3499,101 @@ def user_avatar(user_id):
 @app.route('/notifications/mark_read', methods=['POST'])
 @login_required
 def notifications_mark_read():
-    nid = request.form.get('id')
+    status, body = mark_notifications_read(current_user.id, request.form.get('id'))
+    if status != 200:
+        return jsonify(body), status
+    db.session.commit()
+    return jsonify(body)
+
+
+def mark_notifications_read(user_id, nid):
+    """Mark one notification (by id) or 'all' of a user's notifications read inside the current
+    transaction (the caller commits). Returns (status, body). Unread means `read IS NOT TRUE`, as
+    in the unread counter, so legacy rows with read NULL are cleared too."""
     if nid == 'all':
-        Notification.query.filter_by(user_id=current_user.id, read=False).update({'read': True})
-        db.session.commit()
-        return jsonify({'ok': True})
+        Notification.query.filter(Notification.user_id == user_id, Notification.read.isnot(True)).update({'read': True})
+        UserCounters.query.filter_by(user_id=user_id).update({'unread_notifications': 0})
+        publish_live(f'user:{user_id}', 'unread', unread=0)
+        return 200, {'ok': True}
     try:
         nid_i = int(nid)
     except Exception:
-        return jsonify({'ok': False}), 400
+        return 400, {'ok': False}
     n = Notification.query.get(nid_i)
-    if not n or n.user_id != current_user.id:
-        return jsonify({'ok': False}), 404
-    n.read = True
-    db.session.commit()
-    return jsonify({'ok': True})
+    if not n or n.user_id != user_id:
+        return 404, {'ok': False}
+    if Notification.query.filter(Notification.id == n.id, Notification.read.isnot(True)).update({'read': True}):
+        live_unread_event(user_id, bump_counters(user_id, unread_notifications=-1))
+    return 200, {'ok': True}
+
+
+# --- Batched interactions ---
+# app.js queues likes, comments and mark-read clicks for a moment and sends them together, so a
+# burst of taps costs one request, one login load and one commit.
+BATCH_MAX_OPS = 50
+
+
+class _BatchOpFailed(Exception):
+    def __init__(self, status, body):
+        super().__init__(status)
+        self.status = status
+        self.body = body
+
+
+def _batch_comment(op):
+    return add_comment(int(op.get('post_id') or 0), op.get('text'), current_user.id,
+                       current_user.display_name or current_user.username, current_user.avatar)
+
+
+BATCH_OPS = {
+    'like': lambda op: apply_like(current_user.id, int(op.get('post_id') or 0), want=True),
+    'unlike': lambda op: apply_like(current_user.id, int(op.get('post_id') or 0), want=False),
+    'comment': _batch_comment,
+    'mark_read': lambda op: mark_notifications_read(current_user.id, str(op.get('id'))),
+}
+
+
+@app.route('/api/batch', methods=['POST'])
+@login_required
+def api_batch():
+    """Run a list of interactions in one transaction: {"ops": [{"op": "like", "post_id": 1},
+    {"op": "unlike", "post_id": 2}, {"op": "comment", "post_id": 1, "text": "..."},
+    {"op": "mark_read", "id": 5 or "all"}]}. Each op runs in a savepoint, so a failing op is
+    undone alone; results come back in order, each with the op's HTTP-style status."""
+    ops = (request.get_json(silent=True) or {}).get('ops')
+    if not isinstance(ops, list) or not ops or len(ops) > BATCH_MAX_OPS:
+        return jsonify({'ok': False, 'error': f'ops must be a list of 1-{BATCH_MAX_OPS} operations'}), 400
+    results = []
+    for op in ops:
+        handler = BATCH_OPS.get(op.get('op')) if isinstance(op, dict) else None
+        if handler is None:
+            results.append({'ok': False, 'status': 400, 'error': 'unknown op'})
+            continue
+        queued = len(g.get('after_commit', []))
+        try:
+            with db.session.begin_nested():
+                status, body = handler(op)
+                if status != 200:
+                    raise _BatchOpFailed(status, body)
+        except _BatchOpFailed as e:
+            status, body = e.status, e.body
+        except (TypeError, ValueError):
+            status, body = 400, {'ok': False, 'error': 'bad op'}
+        except IntegrityError:
+            status, body = 404, {'ok': False}
+        except Exception:
+            app.logger.exception('batch op %r failed', op.get('op'))
+            status, body = 500, {'ok': False}
+        if status != 200:
+            del g.setdefault('after_commit', [])[queued:]
+        results.append(dict(body, status=status))
+    try:
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        return jsonify({'ok': False}), 500
+    run_after_commit()
+    return jsonify({'ok': True, 'results': results})
 
 @app.route('/register', methods=['GET', 'POST'])
 def register():
@@ -1592,6 +3604,8 @@ def register():
             hashed = generate_password_hash(password)
             new_user = User(username=username, password=hashed, display_name=username)
             db.session.add(new_user)
+            db.session.flush()
+            db.session.add(UserCounters(user_id=new_user.id))
             db.session.commit()
             flash('註冊成功！請登入')
             return redirect(url_for('login'))
@@ -0,0 +1,51 @@
+"""
+Built-in badge definitions, shared by app.py and tools/apply_badge_schema.py.
+
+Each badge's `criteria` is the rule stored in Badge.criteria_json: the badge is earned once
+`<metric> <op> <threshold>` holds for a user. Metrics are the user_counters columns plus the
+user's streak_days.
+"""
+import json
+
+BADGE_METRICS = ('streak_days', 'total_minutes', 'post_count', 'likes_received', 'comments_received', 'friend_count')
+BADGE_OPERATORS = ('>=', '>')
+
+BADGE_DEFINITIONS = {
+    'streak_3': {'title': '3 Day Streak', 'desc': 'Complete 3 consecutive check-ins', 'slug': 'streak_3', 'image_files': ['3 day.png'],
+                 'criteria': {'metric': 'streak_days', 'op': '>=', 'threshold': 3}},
+    'streak_7': {'title': '7 Day Streak', 'desc': 'Complete 7 consecutive check-ins', 'slug': 'streak_7', 'image_files': ['7 day.png'],
+                 'criteria': {'metric': 'streak_days', 'op': '>=', 'threshold': 7}},
+    'hours_50': {'title': '50 Hours', 'desc': 'Accumulate 50 hours of activity', 'slug': 'hours_50', 'image_files': ['50 hour.png', '50hour.png'],
+                 'criteria': {'metric': 'total_minutes', 'op': '>=', 'threshold': 50 * 60}},
+    'hours_100': {'title': '100 Hours', 'desc': 'Accumulate 100 hours of activity', 'slug': 'hours_100', 'image_files': ['100hour.png'],
+                  'criteria': {'metric': 'total_minutes', 'op': '>=', 'threshold': 100 * 60}},
+    'hours_500': {'title': '500 Hours', 'desc': 'Accumulate 500 hours of activity', 'slug': 'hours_500', 'image_files': ['500 hour.png'],
+                  'criteria': {'metric': 'total_minutes', 'op': '>=', 'threshold': 500 * 60}},
+    'comments_5': {'title': '5 Comments', 'desc': 'Receive 5 comments on your posts', 'slug': 'comments_5', 'image_files': ['5com.png'],
+                   'criteria': {'metric': 'comments_received', 'op': '>=', 'threshold': 5}},
+    'likes_10': {'title': '10 Likes', 'desc': 'Receive 10 likes on your posts', 'slug': 'likes_10', 'image_files': ['10good.png'],
+                 'criteria': {'metric': 'likes_received', 'op': '>=', 'threshold': 10}},
+    'friends_3': {'title': '3 Friends', 'desc': 'Have 3 friends', 'slug': 'friends_3', 'image_files': ['3friend.png'],
+                  'criteria': {'metric': 'friend_count', 'op': '>=', 'threshold': 3}},
+    'friends_10': {'title': '10 Friends', 'desc': 'Have 10 friends', 'slug': 'friends_10', 'image_files': ['10friend.png'],
+                   'criteria': {'metric': 'friend_count', 'op': '>=', 'threshold': 10}},
+}
+
+
+def criteria_json(slug):
+    """criteria_json value for a built-in badge."""
+    return json.dumps(BADGE_DEFINITIONS[slug]['criteria'])
+
+
+def parse_criteria(raw):
+    """Validate a criteria_json string (or dict). Returns (metric, op, threshold); raises ValueError."""
+    try:
+        rule = json.loads(raw) if isinstance(raw, str) else raw
+        metric, op, threshold = rule['metric'], rule.get('op', '>='), int(rule['threshold'])
+    except (TypeError, KeyError, ValueError) as e:
+        raise ValueError(f'bad badge criteria {raw!r}: {e}')
+    if metric not in BADGE_METRICS:
+        raise ValueError(f'unknown badge metric {metric!r}')
+    if op not in BADGE_OPERATORS:
+        raise ValueError(f'unsupported badge operator {op!r}')
+    return metric, op, threshold
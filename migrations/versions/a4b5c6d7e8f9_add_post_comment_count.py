@@ -0,0 +1,42 @@
+"""add post.comment_count and comment (post_id, time) index
+
+Revision ID: a4b5c6d7e8f9
+Revises: f3a4b5c6d7e8
+Create Date: 2026-10-18 07:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'a4b5c6d7e8f9'
+down_revision = 'f3a4b5c6d7e8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    insp = sa.inspect(conn)
+    cols = {c['name'] for c in insp.get_columns('post')}
+    if 'comment_count' not in cols:
+        with op.batch_alter_table('post') as batch_op:
+            batch_op.add_column(sa.Column('comment_count', sa.Integer(), nullable=False, server_default='0'))
+    # backfill even when the column already exists (db.create_all may have added it empty)
+    post = sa.table('post', sa.column('id', sa.Integer), sa.column('comment_count', sa.Integer))
+    comment = sa.table('comment', sa.column('id', sa.Integer), sa.column('post_id', sa.Integer))
+    actual = sa.select(sa.func.count(comment.c.id)).where(comment.c.post_id == post.c.id).scalar_subquery()
+    conn.execute(post.update().where(post.c.comment_count != actual).values(comment_count=actual))
+    indexes = {ix['name'] for ix in insp.get_indexes('comment')}
+    if 'ix_comment_post_id_time' not in indexes:
+        op.create_index('ix_comment_post_id_time', 'comment', ['post_id', 'time'])
+
+
+def downgrade():
+    conn = op.get_bind()
+    insp = sa.inspect(conn)
+    if 'ix_comment_post_id_time' in {ix['name'] for ix in insp.get_indexes('comment')}:
+        op.drop_index('ix_comment_post_id_time', table_name='comment')
+    if 'comment_count' in {c['name'] for c in insp.get_columns('post')}:
+        with op.batch_alter_table('post') as batch_op:
+            batch_op.drop_column('comment_count')
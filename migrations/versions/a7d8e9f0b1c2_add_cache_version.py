@@ -0,0 +1,40 @@
+"""add cache_version and post.cache_version for cross-worker cache invalidation
+
+Revision ID: a7d8e9f0b1c2
+Revises: f1c2d3e4a5b6
+Create Date: 2026-10-18 00:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'a7d8e9f0b1c2'
+down_revision = 'f1c2d3e4a5b6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    insp = sa.inspect(conn)
+    if 'cache_version' not in insp.get_table_names():
+        op.create_table(
+            'cache_version',
+            sa.Column('name', sa.String(length=80), nullable=False),
+            sa.Column('version', sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint('name'),
+        )
+    if 'cache_version' not in {c['name'] for c in insp.get_columns('post')}:
+        with op.batch_alter_table('post') as batch_op:
+            batch_op.add_column(sa.Column('cache_version', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade():
+    conn = op.get_bind()
+    insp = sa.inspect(conn)
+    if 'cache_version' in {c['name'] for c in insp.get_columns('post')}:
+        with op.batch_alter_table('post') as batch_op:
+            batch_op.drop_column('cache_version')
+    if 'cache_version' in insp.get_table_names():
+        op.drop_table('cache_version')
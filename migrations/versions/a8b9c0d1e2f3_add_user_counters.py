@@ -0,0 +1,60 @@
+"""add user_counters (per-user running totals) and populate them
+
+Revision ID: a8b9c0d1e2f3
+Revises: f6a7b8c9d0e1
+Create Date: 2026-10-18 02:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'a8b9c0d1e2f3'
+down_revision = 'f6a7b8c9d0e1'
+branch_labels = None
+depends_on = None
+
+
+def _user_table(insp):
+    return 'users' if 'users' in insp.get_table_names() else 'user'
+
+
+def upgrade():
+    conn = op.get_bind()
+    insp = sa.inspect(conn)
+    users = _user_table(insp)
+    if 'user_counters' not in insp.get_table_names():
+        op.create_table(
+            'user_counters',
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('total_minutes', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('post_count', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('likes_received', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('comments_received', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('friend_count', sa.Integer(), nullable=False, server_default='0'),
+            sa.ForeignKeyConstraint(['user_id'], [f'{users}.id']),
+            sa.PrimaryKeyConstraint('user_id'),
+        )
+    # the app's create_all() may have created the table empty already; only fill an empty table
+    if conn.execute(sa.text('SELECT COUNT(*) FROM user_counters')).scalar():
+        return
+    # same numbers as `flask counters reconcile`
+    op.execute(
+        "INSERT INTO user_counters (user_id, total_minutes, post_count, likes_received, comments_received, friend_count) "
+        "SELECT u.id, COALESCE(p.minutes, 0), COALESCE(p.n, 0), COALESCE(l.n, 0), COALESCE(c.n, 0), COALESCE(f.n, 0) "
+        f'FROM "{users}" u '
+        "LEFT JOIN (SELECT user_id, SUM(CASE WHEN shared_from_id IS NULL THEN minutes ELSE 0 END) AS minutes, COUNT(id) AS n "
+        "FROM post GROUP BY user_id) p ON p.user_id = u.id "
+        'LEFT JOIN (SELECT post.user_id, COUNT("like".id) AS n FROM "like" JOIN post ON post.id = "like".post_id '
+        "GROUP BY post.user_id) l ON l.user_id = u.id "
+        'LEFT JOIN (SELECT post.user_id, COUNT("comment".id) AS n FROM "comment" JOIN post ON post.id = "comment".post_id '
+        "GROUP BY post.user_id) c ON c.user_id = u.id "
+        "LEFT JOIN (SELECT owner_id, COUNT(id) AS n FROM friend GROUP BY owner_id) f ON f.owner_id = u.id"
+    )
+
+
+def downgrade():
+    conn = op.get_bind()
+    insp = sa.inspect(conn)
+    if 'user_counters' in insp.get_table_names():
+        op.drop_table('user_counters')
@@ -0,0 +1,56 @@
+"""add user_daily_minutes rollup and populate it from post
+
+Revision ID: b2c3d4e5f6a7
+Revises: a7d8e9f0b1c2
+Create Date: 2026-10-18 00:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'b2c3d4e5f6a7'
+down_revision = 'a7d8e9f0b1c2'
+branch_labels = None
+depends_on = None
+
+
+def _user_table(insp):
+    return 'users' if 'users' in insp.get_table_names() else 'user'
+
+
+def upgrade():
+    conn = op.get_bind()
+    insp = sa.inspect(conn)
+    if 'user_daily_minutes' not in insp.get_table_names():
+        op.create_table(
+            'user_daily_minutes',
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('local_date', sa.Date(), nullable=False),
+            sa.Column('minutes', sa.Integer(), nullable=False),
+            sa.Column('post_count', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['user_id'], [f'{_user_table(insp)}.id']),
+            sa.PrimaryKeyConstraint('user_id', 'local_date'),
+        )
+        op.create_index('ix_user_daily_minutes_local_date', 'user_daily_minutes', ['local_date'])
+    # the app's create_all() may have created the table empty already; only fill an empty rollup
+    if conn.execute(sa.text('SELECT COUNT(*) FROM user_daily_minutes')).scalar():
+        return
+    # same buckets as `flask rollup rebuild` (Asia/Taipei days, shares excluded)
+    if conn.dialect.name == 'postgresql':
+        day = "date(timezone('Asia/Taipei', timezone('UTC', created_at)))"
+    else:
+        day = "date(created_at, '+8 hours')"
+    op.execute(
+        "INSERT INTO user_daily_minutes (user_id, local_date, minutes, post_count) "
+        f"SELECT user_id, {day}, COALESCE(SUM(minutes), 0), COUNT(id) FROM post "
+        f"WHERE shared_from_id IS NULL AND created_at IS NOT NULL GROUP BY user_id, {day}"
+    )
+
+
+def downgrade():
+    conn = op.get_bind()
+    insp = sa.inspect(conn)
+    if 'user_daily_minutes' in insp.get_table_names():
+        op.drop_index('ix_user_daily_minutes_local_date', table_name='user_daily_minutes')
+        op.drop_table('user_daily_minutes')
@@ -0,0 +1,38 @@
+"""backfill comment.user_id from the stored author name
+
+Revision ID: b5c6d7e8f9a0
+Revises: a4b5c6d7e8f9
+Create Date: 2026-10-18 07:50:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'b5c6d7e8f9a0'
+down_revision = 'a4b5c6d7e8f9'
+branch_labels = None
+depends_on = None
+
+
+def _user_table(insp):
+    return 'users' if 'users' in insp.get_table_names() else 'user'
+
+
+def upgrade():
+    conn = op.get_bind()
+    insp = sa.inspect(conn)
+    # comment.user holds the author's display name at comment time (or the username when none was
+    # set); link it only when exactly one user has that username or display name
+    users = sa.table(_user_table(insp), sa.column('id', sa.Integer), sa.column('username', sa.String),
+                     sa.column('display_name', sa.String)).alias('u')
+    comment = sa.table('comment', sa.column('user_id', sa.Integer), sa.column('user', sa.String))
+    matches = sa.or_(users.c.username == comment.c.user, users.c.display_name == comment.c.user)
+    only = sa.select(sa.func.count(users.c.id)).where(matches).scalar_subquery()
+    author = sa.select(sa.func.min(users.c.id)).where(matches).scalar_subquery()
+    conn.execute(comment.update().where(comment.c.user_id.is_(None), comment.c.user.isnot(None), only == 1).values(user_id=author))
+
+
+def downgrade():
+    # the backfilled ids are indistinguishable from ones written by the app; leave them
+    pass
@@ -0,0 +1,43 @@
+"""add outbox_event for side effects handled by the background worker
+
+Revision ID: b9c0d1e2f3a4
+Revises: a8b9c0d1e2f3
+Create Date: 2026-10-18 02:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'b9c0d1e2f3a4'
+down_revision = 'a8b9c0d1e2f3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    insp = sa.inspect(conn)
+    if 'outbox_event' not in insp.get_table_names():
+        op.create_table(
+            'outbox_event',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('kind', sa.String(length=40), nullable=False),
+            sa.Column('payload', sa.Text(), nullable=False),
+            sa.Column('status', sa.String(length=10), nullable=False, server_default='pending'),
+            sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('available_at', sa.DateTime(), nullable=False, server_default=sa.func.now()),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('processed_at', sa.DateTime(), nullable=True),
+            sa.Column('last_error', sa.Text(), nullable=True),
+            sa.PrimaryKeyConstraint('id'),
+        )
+    existing = {ix['name'] for ix in sa.inspect(conn).get_indexes('outbox_event')}
+    if 'ix_outbox_event_status_available_at' not in existing:
+        op.create_index('ix_outbox_event_status_available_at', 'outbox_event', ['status', 'available_at'])
+
+
+def downgrade():
+    conn = op.get_bind()
+    if 'outbox_event' in sa.inspect(conn).get_table_names():
+        op.drop_table('outbox_event')
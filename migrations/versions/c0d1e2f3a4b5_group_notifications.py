@@ -0,0 +1,57 @@
+"""group notifications per recipient, verb, post and time window
+
+Revision ID: c0d1e2f3a4b5
+Revises: b9c0d1e2f3a4
+Create Date: 2026-10-18 03:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'c0d1e2f3a4b5'
+down_revision = 'b9c0d1e2f3a4'
+branch_labels = None
+depends_on = None
+
+
+def _user_table(insp):
+    return 'users' if 'users' in insp.get_table_names() else 'user'
+
+
+def upgrade():
+    conn = op.get_bind()
+    insp = sa.inspect(conn)
+    cols = {c['name'] for c in insp.get_columns('notification')}
+    with op.batch_alter_table('notification') as batch_op:
+        if 'group_key' not in cols:
+            batch_op.add_column(sa.Column('group_key', sa.String(length=120), nullable=True))
+        if 'actor_count' not in cols:
+            batch_op.add_column(sa.Column('actor_count', sa.Integer(), nullable=False, server_default='1'))
+        if 'recent_actors' not in cols:
+            batch_op.add_column(sa.Column('recent_actors', sa.Text(), nullable=True))
+    # existing rows keep group_key NULL, so they stay as individual notifications
+    existing = {ix['name'] for ix in sa.inspect(conn).get_indexes('notification')}
+    if 'uix_notification_user_group' not in existing:
+        op.create_index('uix_notification_user_group', 'notification', ['user_id', 'group_key'], unique=True)
+    # distinct actors of each grouped row; no existing row is grouped yet, so nothing to seed
+    if 'notification_actor' not in insp.get_table_names():
+        op.create_table(
+            'notification_actor',
+            sa.Column('notification_id', sa.Integer(), sa.ForeignKey('notification.id'), primary_key=True),
+            sa.Column('actor_id', sa.Integer(), sa.ForeignKey(f'{_user_table(insp)}.id'), primary_key=True),
+        )
+
+
+def downgrade():
+    conn = op.get_bind()
+    if 'notification_actor' in sa.inspect(conn).get_table_names():
+        op.drop_table('notification_actor')
+    existing = {ix['name'] for ix in sa.inspect(conn).get_indexes('notification')}
+    if 'uix_notification_user_group' in existing:
+        op.drop_index('uix_notification_user_group', table_name='notification')
+    cols = {c['name'] for c in sa.inspect(conn).get_columns('notification')}
+    with op.batch_alter_table('notification') as batch_op:
+        for name in ('recent_actors', 'actor_count', 'group_key'):
+            if name in cols:
+                batch_op.drop_column(name)
@@ -0,0 +1,52 @@
+"""add user_monthly_minutes rollup and populate it from user_daily_minutes
+
+Revision ID: c3d4e5f6a7b8
+Revises: b2c3d4e5f6a7
+Create Date: 2026-10-18 00:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'c3d4e5f6a7b8'
+down_revision = 'b2c3d4e5f6a7'
+branch_labels = None
+depends_on = None
+
+
+def _user_table(insp):
+    return 'users' if 'users' in insp.get_table_names() else 'user'
+
+
+def upgrade():
+    conn = op.get_bind()
+    insp = sa.inspect(conn)
+    if 'user_monthly_minutes' not in insp.get_table_names():
+        op.create_table(
+            'user_monthly_minutes',
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('month', sa.Date(), nullable=False),
+            sa.Column('minutes', sa.Integer(), nullable=False),
+            sa.Column('post_count', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['user_id'], [f'{_user_table(insp)}.id']),
+            sa.PrimaryKeyConstraint('user_id', 'month'),
+        )
+    # the app's create_all() may have created the table empty already; only fill an empty rollup
+    if conn.execute(sa.text('SELECT COUNT(*) FROM user_monthly_minutes')).scalar():
+        return
+    if conn.dialect.name == 'postgresql':
+        month = "CAST(date_trunc('month', local_date) AS DATE)"
+    else:
+        month = "date(local_date, 'start of month')"
+    op.execute(
+        "INSERT INTO user_monthly_minutes (user_id, month, minutes, post_count) "
+        f"SELECT user_id, {month}, SUM(minutes), SUM(post_count) FROM user_daily_minutes GROUP BY user_id, {month}"
+    )
+
+
+def downgrade():
+    conn = op.get_bind()
+    insp = sa.inspect(conn)
+    if 'user_monthly_minutes' in insp.get_table_names():
+        op.drop_table('user_monthly_minutes')
@@ -0,0 +1,50 @@
+"""drop the unused user_monthly_minutes rollup
+
+Revision ID: c6d7e8f9a0b1
+Revises: b5c6d7e8f9a0
+Create Date: 2026-10-18 08:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'c6d7e8f9a0b1'
+down_revision = 'b5c6d7e8f9a0'
+branch_labels = None
+depends_on = None
+
+
+def _user_table(insp):
+    return 'users' if 'users' in insp.get_table_names() else 'user'
+
+
+def upgrade():
+    # all-time standings read user_counters.total_minutes; nothing reads the monthly buckets
+    conn = op.get_bind()
+    if 'user_monthly_minutes' in sa.inspect(conn).get_table_names():
+        op.drop_table('user_monthly_minutes')
+
+
+def downgrade():
+    conn = op.get_bind()
+    insp = sa.inspect(conn)
+    if 'user_monthly_minutes' in insp.get_table_names():
+        return
+    op.create_table(
+        'user_monthly_minutes',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('month', sa.Date(), nullable=False),
+        sa.Column('minutes', sa.Integer(), nullable=False),
+        sa.Column('post_count', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], [f'{_user_table(insp)}.id']),
+        sa.PrimaryKeyConstraint('user_id', 'month'),
+    )
+    if conn.dialect.name == 'postgresql':
+        month = "CAST(date_trunc('month', local_date) AS DATE)"
+    else:
+        month = "date(local_date, 'start of month')"
+    op.execute(
+        "INSERT INTO user_monthly_minutes (user_id, month, minutes, post_count) "
+        f"SELECT user_id, {month}, SUM(minutes), SUM(post_count) FROM user_daily_minutes GROUP BY user_id, {month}"
+    )
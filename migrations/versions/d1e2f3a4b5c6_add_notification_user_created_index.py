@@ -0,0 +1,29 @@
+"""index notification (user_id, created_at) for the paginated notifications page
+
+Revision ID: d1e2f3a4b5c6
+Revises: c0d1e2f3a4b5
+Create Date: 2026-10-18 04:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'd1e2f3a4b5c6'
+down_revision = 'c0d1e2f3a4b5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    existing = {ix['name'] for ix in sa.inspect(conn).get_indexes('notification')}
+    if 'ix_notification_user_id_created_at' not in existing:
+        op.create_index('ix_notification_user_id_created_at', 'notification', ['user_id', 'created_at'])
+
+
+def downgrade():
+    conn = op.get_bind()
+    existing = {ix['name'] for ix in sa.inspect(conn).get_indexes('notification')}
+    if 'ix_notification_user_id_created_at' in existing:
+        op.drop_index('ix_notification_user_id_created_at', table_name='notification')
@@ -0,0 +1,57 @@
+"""add leaderboard_week / leaderboard_snapshot for frozen weekly standings
+
+Revision ID: d4e5f6a7b8c9
+Revises: c3d4e5f6a7b8
+Create Date: 2026-10-18 01:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'd4e5f6a7b8c9'
+down_revision = 'c3d4e5f6a7b8'
+branch_labels = None
+depends_on = None
+
+
+def _user_table(insp):
+    return 'users' if 'users' in insp.get_table_names() else 'user'
+
+
+def upgrade():
+    conn = op.get_bind()
+    insp = sa.inspect(conn)
+    tables = insp.get_table_names()
+    if 'leaderboard_week' not in tables:
+        op.create_table(
+            'leaderboard_week',
+            sa.Column('week_start', sa.Date(), nullable=False),
+            sa.Column('frozen_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('week_start'),
+        )
+    if 'leaderboard_snapshot' not in tables:
+        op.create_table(
+            'leaderboard_snapshot',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('week_start', sa.Date(), nullable=False),
+            sa.Column('rank', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('points', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['week_start'], ['leaderboard_week.week_start']),
+            sa.ForeignKeyConstraint(['user_id'], [f'{_user_table(insp)}.id']),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('week_start', 'user_id', name='uix_leaderboard_snapshot_week_user'),
+        )
+    existing = {ix['name'] for ix in sa.inspect(conn).get_indexes('leaderboard_snapshot')}
+    if 'ix_leaderboard_snapshot_week_rank' not in existing:
+        op.create_index('ix_leaderboard_snapshot_week_rank', 'leaderboard_snapshot', ['week_start', 'rank'])
+
+
+def downgrade():
+    conn = op.get_bind()
+    tables = sa.inspect(conn).get_table_names()
+    if 'leaderboard_snapshot' in tables:
+        op.drop_table('leaderboard_snapshot')
+    if 'leaderboard_week' in tables:
+        op.drop_table('leaderboard_week')
@@ -0,0 +1,37 @@
+"""add user_counters.unread_notifications
+
+Revision ID: e2f3a4b5c6d7
+Revises: d1e2f3a4b5c6
+Create Date: 2026-10-18 04:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'e2f3a4b5c6d7'
+down_revision = 'd1e2f3a4b5c6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    cols = {c['name'] for c in sa.inspect(conn).get_columns('user_counters')}
+    if 'unread_notifications' in cols:
+        return
+    with op.batch_alter_table('user_counters') as batch_op:
+        batch_op.add_column(sa.Column('unread_notifications', sa.Integer(), nullable=False, server_default='0'))
+    counters = sa.table('user_counters', sa.column('user_id', sa.Integer), sa.column('unread_notifications', sa.Integer))
+    notification = sa.table('notification', sa.column('id', sa.Integer), sa.column('user_id', sa.Integer), sa.column('read', sa.Boolean))
+    unread = sa.select(sa.func.count(notification.c.id)).where(
+        notification.c.user_id == counters.c.user_id, notification.c.read.isnot(True)).scalar_subquery()
+    conn.execute(counters.update().values(unread_notifications=unread))
+
+
+def downgrade():
+    conn = op.get_bind()
+    cols = {c['name'] for c in sa.inspect(conn).get_columns('user_counters')}
+    if 'unread_notifications' in cols:
+        with op.batch_alter_table('user_counters') as batch_op:
+            batch_op.drop_column('unread_notifications')
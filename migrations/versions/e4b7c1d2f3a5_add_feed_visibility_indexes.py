@@ -0,0 +1,46 @@
+"""add indexes for the keyset feed and friends-only visibility
+
+Revision ID: e4b7c1d2f3a5
+Revises: d1a2b3c4rename
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'e4b7c1d2f3a5'
+down_revision = 'd1a2b3c4rename'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ('ix_post_created_at_id', 'post', ['created_at', 'id']),
+    ('ix_post_user_id_created_at', 'post', ['user_id', 'created_at']),
+    ('ix_friend_owner_id_friend_name', 'friend', ['owner_id', 'friend_name']),
+]
+
+
+def _existing_indexes(insp, table):
+    try:
+        return {ix['name'] for ix in insp.get_indexes(table)}
+    except Exception:
+        return set()
+
+
+def upgrade():
+    conn = op.get_bind()
+    insp = sa.inspect(conn)
+    for name, table, cols in INDEXES:
+        # db.create_all() may already have created them on fresh databases
+        if name not in _existing_indexes(insp, table):
+            op.create_index(name, table, cols)
+
+
+def downgrade():
+    conn = op.get_bind()
+    insp = sa.inspect(conn)
+    for name, table, cols in reversed(INDEXES):
+        if name in _existing_indexes(insp, table):
+            op.drop_index(name, table_name=table)
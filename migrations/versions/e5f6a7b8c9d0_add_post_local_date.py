@@ -0,0 +1,43 @@
+"""add post.local_date (Asia/Taipei day of created_at), backfill it and index (user_id, local_date)
+
+Revision ID: e5f6a7b8c9d0
+Revises: d4e5f6a7b8c9
+Create Date: 2026-10-18 01:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'e5f6a7b8c9d0'
+down_revision = 'd4e5f6a7b8c9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    insp = sa.inspect(conn)
+    cols = {c['name'] for c in insp.get_columns('post')}
+    if 'local_date' not in cols:
+        op.add_column('post', sa.Column('local_date', sa.Date(), nullable=True))
+    if conn.dialect.name == 'postgresql':
+        day = "date(timezone('Asia/Taipei', timezone('UTC', created_at)))"
+    else:
+        # SQLite has no tz database; Taipei has no DST so a fixed offset is exact
+        day = "date(created_at, '+8 hours')"
+    op.execute(f"UPDATE post SET local_date = {day} WHERE local_date IS NULL AND created_at IS NOT NULL")
+    existing = {ix['name'] for ix in sa.inspect(conn).get_indexes('post')}
+    if 'ix_post_user_id_local_date' not in existing:
+        op.create_index('ix_post_user_id_local_date', 'post', ['user_id', 'local_date'])
+
+
+def downgrade():
+    conn = op.get_bind()
+    insp = sa.inspect(conn)
+    existing = {ix['name'] for ix in insp.get_indexes('post')}
+    if 'ix_post_user_id_local_date' in existing:
+        op.drop_index('ix_post_user_id_local_date', table_name='post')
+    if 'local_date' in {c['name'] for c in insp.get_columns('post')}:
+        with op.batch_alter_table('post') as batch_op:
+            batch_op.drop_column('local_date')
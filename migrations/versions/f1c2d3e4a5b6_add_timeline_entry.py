@@ -0,0 +1,84 @@
+"""add timeline_entry for fan-out-on-write feeds
+
+Revision ID: f1c2d3e4a5b6
+Revises: e4b7c1d2f3a5
+Create Date: 2026-10-18 00:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'f1c2d3e4a5b6'
+down_revision = 'e4b7c1d2f3a5'
+branch_labels = None
+depends_on = None
+
+PUBLIC_TIMELINE_ID = 0
+
+
+def _user_table(insp):
+    return 'users' if 'users' in insp.get_table_names() else 'user'
+
+
+def _backfill(conn, insp):
+    """Same rows as `flask timeline backfill`, skipping (owner, post) pairs that already exist, so
+    it also fills a table that create_all() made (and the app may have started writing to)."""
+    post = sa.table('post', sa.column('id', sa.Integer), sa.column('user_id', sa.Integer), sa.column('created_at', sa.DateTime),
+                    sa.column('visibility', sa.String))
+    friend = sa.table('friend', sa.column('owner_id', sa.Integer), sa.column('friend_name', sa.String))
+    users = sa.table(_user_table(insp), sa.column('id', sa.Integer), sa.column('username', sa.String))
+    timeline = sa.table('timeline_entry', sa.column('owner_id', sa.Integer), sa.column('post_id', sa.Integer),
+                        sa.column('author_id', sa.Integer), sa.column('created_at', sa.DateTime))
+    cols = ['owner_id', 'post_id', 'author_id', 'created_at']
+    is_public = sa.or_(post.c.visibility == 'public', post.c.visibility.is_(None))
+
+    def missing(owner):
+        return ~sa.exists().where(timeline.c.owner_id == owner, timeline.c.post_id == post.c.id)
+
+    dated = post.c.created_at.isnot(None)
+    # public posts -> shared timeline
+    conn.execute(timeline.insert().from_select(cols, sa.select(
+        sa.literal(PUBLIC_TIMELINE_ID), post.c.id, post.c.user_id, post.c.created_at).where(is_public, dated, missing(PUBLIC_TIMELINE_ID))))
+    # friends-only posts -> author
+    conn.execute(timeline.insert().from_select(cols, sa.select(
+        post.c.user_id, post.c.id, post.c.user_id, post.c.created_at).where(~is_public, dated, missing(post.c.user_id))))
+    # friends-only posts -> everyone who has the author as a friend
+    conn.execute(timeline.insert().from_select(cols, sa.select(
+        friend.c.owner_id, post.c.id, post.c.user_id, post.c.created_at).distinct()
+        .select_from(post.join(users, users.c.id == post.c.user_id).join(friend, friend.c.friend_name == users.c.username))
+        .where(~is_public, dated, friend.c.owner_id != post.c.user_id, missing(friend.c.owner_id))))
+
+
+def upgrade():
+    conn = op.get_bind()
+    insp = sa.inspect(conn)
+    if 'timeline_entry' not in insp.get_table_names():
+        op.create_table(
+            'timeline_entry',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('owner_id', sa.Integer(), nullable=False),
+            sa.Column('post_id', sa.Integer(), nullable=False),
+            sa.Column('author_id', sa.Integer(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=False),
+            sa.ForeignKeyConstraint(['post_id'], ['post.id']),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('owner_id', 'post_id', name='uix_timeline_owner_post'),
+        )
+        op.create_index('ix_timeline_owner_created_post', 'timeline_entry', ['owner_id', 'created_at', 'post_id'])
+        op.create_index('ix_timeline_post_id', 'timeline_entry', ['post_id'])
+    if 'ix_friend_friend_name' not in {ix['name'] for ix in insp.get_indexes('friend')}:
+        op.create_index('ix_friend_friend_name', 'friend', ['friend_name'])
+    # the feed reads timelines by default (FEED_FROM_TIMELINE), so existing posts must be in them
+    _backfill(conn, insp)
+
+
+def downgrade():
+    conn = op.get_bind()
+    insp = sa.inspect(conn)
+    if 'ix_friend_friend_name' in {ix['name'] for ix in insp.get_indexes('friend')}:
+        op.drop_index('ix_friend_friend_name', table_name='friend')
+    if 'timeline_entry' in insp.get_table_names():
+        op.drop_index('ix_timeline_post_id', table_name='timeline_entry')
+        op.drop_index('ix_timeline_owner_created_post', table_name='timeline_entry')
+        op.drop_table('timeline_entry')
@@ -0,0 +1,38 @@
+"""add live_event for the /events stream
+
+Revision ID: f3a4b5c6d7e8
+Revises: e2f3a4b5c6d7
+Create Date: 2026-10-18 05:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'f3a4b5c6d7e8'
+down_revision = 'e2f3a4b5c6d7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    if 'live_event' not in sa.inspect(conn).get_table_names():
+        op.create_table(
+            'live_event',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('topic', sa.String(length=40), nullable=False),
+            sa.Column('kind', sa.String(length=20), nullable=False),
+            sa.Column('data', sa.Text(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=False, server_default=sa.func.now()),
+            sa.PrimaryKeyConstraint('id'),
+        )
+    existing = {ix['name'] for ix in sa.inspect(conn).get_indexes('live_event')}
+    if 'ix_live_event_created_at' not in existing:
+        op.create_index('ix_live_event_created_at', 'live_event', ['created_at'])
+
+
+def downgrade():
+    conn = op.get_bind()
+    if 'live_event' in sa.inspect(conn).get_table_names():
+        op.drop_table('live_event')
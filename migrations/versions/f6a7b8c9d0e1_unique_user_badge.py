@@ -0,0 +1,43 @@
+"""dedupe user_badge and make (user_id, badge_id) unique
+
+Revision ID: f6a7b8c9d0e1
+Revises: e5f6a7b8c9d0
+Create Date: 2026-10-18 01:50:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'f6a7b8c9d0e1'
+down_revision = 'e5f6a7b8c9d0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    insp = sa.inspect(conn)
+    if 'user_badge' not in insp.get_table_names():
+        return
+    existing = {ix['name'] for ix in insp.get_indexes('user_badge')}
+    if 'uix_user_badge_user_badge' in existing:
+        return
+    # keep the earliest award per (user, badge); it stays pinned if any duplicate was
+    op.execute(
+        "UPDATE user_badge SET pinned = TRUE WHERE id IN ("
+        "SELECT MIN(id) FROM user_badge GROUP BY user_id, badge_id HAVING COUNT(*) > 1 AND MAX(CASE WHEN pinned THEN 1 ELSE 0 END) = 1)"
+    )
+    op.execute(
+        "DELETE FROM user_badge WHERE id NOT IN (SELECT MIN(id) FROM user_badge GROUP BY user_id, badge_id)"
+    )
+    op.create_index('uix_user_badge_user_badge', 'user_badge', ['user_id', 'badge_id'], unique=True)
+
+
+def downgrade():
+    conn = op.get_bind()
+    insp = sa.inspect(conn)
+    if 'user_badge' in insp.get_table_names():
+        existing = {ix['name'] for ix in insp.get_indexes('user_badge')}
+        if 'uix_user_badge_user_badge' in existing:
+            op.drop_index('uix_user_badge_user_badge', table_name='user_badge')
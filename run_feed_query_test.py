@@ -0,0 +1,93 @@
+from app import app, db, User, Post, Comment, Like, Friend, Badge, UserBadge, fetch_feed_page, assemble_feed_posts, rebuild_timelines
+from werkzeug.security import generate_password_hash
+from flask_login import login_user
+from sqlalchemy import event
+from datetime import datetime, timedelta
+import traceback
+
+
+def seed():
+    """Create a viewer, a few friends and enough posts (with comments, likes, shares, pinned badges) for a 50-post page."""
+    users = []
+    for name in ['fq_viewer', 'fq_friend', 'fq_other']:
+        u = User.query.filter_by(username=name).first()
+        if not u:
+            u = User(username=name, password=generate_password_hash('pass'), display_name=name)
+            db.session.add(u)
+            db.session.commit()
+        users.append(u)
+    viewer, friend, other = users
+    if not Friend.query.filter_by(owner_id=viewer.id, friend_name=friend.username).first():
+        db.session.add(Friend(owner_id=viewer.id, friend_name=friend.username))
+    b = Badge.query.filter_by(slug='fq_badge').first()
+    if not b:
+        b = Badge(title='FQ', desc='query test', slug='fq_badge', image_filename='3 day.png')
+        db.session.add(b)
+        db.session.flush()
+    for u in users:
+        if not UserBadge.query.filter_by(user_id=u.id, badge_id=b.id).first():
+            db.session.add(UserBadge(user_id=u.id, badge_id=b.id, pinned=True))
+    db.session.commit()
+
+    now = datetime.utcnow()
+    if Post.query.filter(Post.user_id.in_([u.id for u in users])).count() < 60:
+        first = None
+        for i in range(60):
+            author = users[i % 3]
+            p = Post(user_id=author.id, sport='跑步', minutes=10, message=f'@fq_viewer post {i}',
+                     visibility='friends' if i % 4 == 0 else 'public',
+                     shared_from_id=first.id if (first and i % 5 == 0) else None,
+                     created_at=now - timedelta(minutes=i))
+            db.session.add(p)
+            db.session.flush()
+            first = first or p
+            db.session.add(Comment(post_id=p.id, user=other.username, user_id=other.id, text='nice'))
+            db.session.add(Comment(post_id=p.id, user=friend.username, user_id=friend.id, text='great'))
+            db.session.add(Like(user_id=viewer.id, post_id=p.id))
+        db.session.commit()
+        # posts were inserted directly, so materialize the timelines the feed reads from
+        rebuild_timelines()
+    return viewer
+
+
+def count_queries(fn):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        result = fn()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+    return len(statements), result
+
+
+def main():
+    with app.app_context():
+        db.create_all()
+        viewer_id = seed().id
+
+    counts = {}
+    for size in (10, 50):
+        with app.test_request_context('/'):
+            login_user(User.query.get(viewer_id))
+
+            def build():
+                page, _ = fetch_feed_page(limit=size)
+                return assemble_feed_posts(page)
+
+            n, posts = count_queries(build)
+            counts[size] = n
+            print(f'page size {size}: {len(posts)} posts, {n} queries')
+            assert len(posts) == size, 'page came back short'
+    assert counts[10] == counts[50], f'query count grows with page size: {counts}'
+    print('OK: constant query count per page')
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except Exception:
+        traceback.print_exc()
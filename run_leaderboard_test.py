@@ -1,4 +1,4 @@
-from app import app, db, User, Post
+from app import app, db, User, Post, rebuild_daily_rollup, reconcile_counters
 from werkzeug.security import generate_password_hash
 import traceback
 
@@ -18,6 +18,9 @@ def main():
             p2 = Post(user_id=u.id, sport='游泳', minutes=20, created_at=now - timedelta(days=2))
             db.session.add_all([p1, p2])
             db.session.commit()
+            # posts were inserted directly, so refresh the daily rollup and counters the page reads
+            rebuild_daily_rollup()
+            reconcile_counters()
 
     app.testing = True
     c = app.test_client()
@@ -0,0 +1,83 @@
+from app import app, db, User, Post, Like, UserCounters, reconcile_counters, like_buffer
+from werkzeug.security import generate_password_hash
+from concurrent.futures import ThreadPoolExecutor
+import random
+import traceback
+
+USERS = 12
+TOGGLES_PER_USER = 15
+
+
+def seed():
+    """An author with one post and USERS likers who all start without a like."""
+    names = ['ls_author'] + [f'ls_user{i}' for i in range(USERS)]
+    for name in names:
+        if not User.query.filter_by(username=name).first():
+            db.session.add(User(username=name, password=generate_password_hash('pass'), display_name=name))
+    db.session.commit()
+    author = User.query.filter_by(username='ls_author').first()
+    post = Post.query.filter_by(user_id=author.id, message='like stress').first()
+    if not post:
+        post = Post(user_id=author.id, sport='跑步', minutes=10, message='like stress')
+        db.session.add(post)
+        db.session.commit()
+    Like.query.filter_by(post_id=post.id).delete()
+    post.likes = 0
+    db.session.commit()
+    reconcile_counters()
+    return post.id, author.id, names[1:]
+
+
+def toggler(name, post_id):
+    """Log in as `name` and toggle the like TOGGLES_PER_USER times (some as double-clicks); returns
+    (expected liked state, number of failed requests)."""
+    c = app.test_client()
+    c.post('/login', data={'username': name, 'password': 'pass'})
+    liked, failures = False, 0
+    for _ in range(TOGGLES_PER_USER):
+        r = c.post('/like', data={'post_id': post_id})
+        j = r.get_json(silent=True) or {}
+        if r.status_code != 200 or not j.get('ok'):
+            failures += 1
+            continue
+        liked = j['liked']
+        if random.random() < 0.3:
+            # a second toggle right behind the first, like a double click
+            r = c.post('/like', data={'post_id': post_id})
+            j = r.get_json(silent=True) or {}
+            if r.status_code == 200 and j.get('ok'):
+                liked = j['liked']
+            else:
+                failures += 1
+    return liked, failures
+
+
+def main():
+    app.testing = True
+    with app.app_context():
+        db.create_all()
+        post_id, author_id, names = seed()
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda n: toggler(n, post_id), names))
+
+    with app.app_context():
+        # LIKE_WRITE_BEHIND=1 keeps counter deltas in memory until the next flush
+        like_buffer.flush()
+        likes = db.session.get(Post, post_id).likes
+        rows = Like.query.filter_by(post_id=post_id).count()
+        received = db.session.get(UserCounters, author_id).likes_received
+    expected = sum(1 for liked, _ in results if liked)
+    failures = sum(f for _, f in results)
+    print(f'post.likes={likes} COUNT(like)={rows} expected={expected} likes_received={received} failed_requests={failures}')
+    if likes == rows == expected == received:
+        print('OK: like counter matches the like rows')
+    else:
+        print('FAIL: like counter drifted')
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except Exception:
+        traceback.print_exc()
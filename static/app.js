@@ -1,27 +1,57 @@
+// Batched interactions: likes, comments and mark-read are queued for BATCH_DELAY ms (or until
+// BATCH_MAX are waiting) and sent together to /api/batch; each caller gets its own op's result.
+const BATCH_DELAY = 150;
+const BATCH_MAX = 20;
+let batchQueue = [];
+let batchTimer = null;
+
+function queueOp(op){
+    return new Promise((resolve, reject) => {
+        batchQueue.push({op, resolve, reject});
+        if(batchQueue.length >= BATCH_MAX) flushOps();
+        else if(!batchTimer) batchTimer = setTimeout(flushOps, BATCH_DELAY);
+    });
+}
+
+function flushOps(keepalive){
+    clearTimeout(batchTimer);
+    batchTimer = null;
+    const items = batchQueue.splice(0, batchQueue.length);
+    if(!items.length) return;
+    fetch('/api/batch', {method: 'POST', headers: {'Content-Type': 'application/json'}, body: JSON.stringify({ops: items.map(i => i.op)}), keepalive: !!keepalive})
+        .then(r => {
+            if(r.status !== 200) throw new Error('Network');
+            return r.json();
+        })
+        .then(j => items.forEach((it, k) => it.resolve(j.results[k])))
+        .catch(err => items.forEach(it => it.reject(err)));
+}
+
+// send whatever is queued before the page goes away
+document.addEventListener('visibilitychange', () => { if(document.visibilityState === 'hidden') flushOps(true); });
+
 // Handle like and comment actions via AJAX
 document.addEventListener('click', function(e){
     if(e.target.closest('.like-btn')){
         const btn = e.target.closest('.like-btn');
         const postId = btn.dataset.postId;
-        const form = new FormData();
-        form.append('post_id', postId);
-        // optimistic UI: disable button until response
-        btn.disabled = true;
-        fetch('/like', {method: 'POST', body: form})
-            .then(r => r.json())
-            .then(data => {
-                if(data.ok){
-                    const count = btn.querySelector('.like-count');
-                    if(count) count.textContent = data.likes;
-                    // toggle visual state if server reports liked
-                    if(typeof data.liked !== 'undefined'){
-                        if(data.liked) btn.classList.add('liked'); else btn.classList.remove('liked');
-                    }
-                } else {
-                    alert('按讚失敗');
+        const count = btn.querySelector('.like-count');
+        // optimistic UI: flip now, then take the server's state once the last queued click returns
+        const liked = btn.classList.toggle('liked');
+        if(count) count.textContent = Math.max(parseInt(count.textContent || '0') + (liked ? 1 : -1), 0);
+        btn.dataset.inflight = (parseInt(btn.dataset.inflight || '0') + 1);
+        queueOp({op: liked ? 'like' : 'unlike', post_id: Number(postId)})
+            .then(res => {
+                if(!res.ok) throw new Error('like');
+                if(btn.dataset.inflight === '1'){
+                    if(count) count.textContent = res.likes;
+                    btn.classList.toggle('liked', res.liked);
                 }
-            }).catch(()=> alert('網路錯誤，按讚失敗'))
-            .finally(()=> btn.disabled = false);
+            }).catch(()=> {
+                btn.classList.toggle('liked', !liked);
+                alert('網路錯誤，按讚失敗');
+            })
+            .finally(()=> btn.dataset.inflight = parseInt(btn.dataset.inflight) - 1);
     }
 
     if(e.target.closest('.share-btn')){
@@ -50,37 +80,75 @@ document.addEventListener('click', function(e){
     }
 });
 
+function commentNode(c){
+    const li = document.createElement('li');
+    let avatar;
+    if(c.avatar){
+        avatar = document.createElement('img');
+        avatar.src = c.avatar;
+        avatar.className = 'avatar';
+        avatar.style.cssText = 'width:28px;height:28px;object-fit:cover;border-radius:50%;margin-right:8px;';
+    } else {
+        avatar = document.createElement('div');
+        avatar.className = 'avatar placeholder';
+        avatar.style.cssText = 'width:28px;height:28px;margin-right:8px;display:inline-flex;align-items:center;justify-content:center;';
+        avatar.textContent = (c.user || '?')[0].toUpperCase();
+    }
+    const name = document.createElement('strong');
+    name.textContent = c.user;
+    const time = document.createElement('span');
+    time.className = 'c-time';
+    time.textContent = c.time;
+    li.append(avatar, name, ': ' + c.text + ' ', time);
+    return li;
+}
+
+// Append a comment to a post's list and update the count on its toggle button
+// (to `count` when the server sent it, otherwise +1)
+function appendComment(postId, c, count){
+    const form = document.querySelector('.comment-form[data-post-id="'+postId+'"]');
+    const list = form && form.parentElement.querySelector('.comment-list');
+    if(list) list.appendChild(commentNode(c));
+    const toggle = document.querySelector('.comment-toggle[data-post-id="'+postId+'"]');
+    if(toggle){
+        const m = toggle.textContent.match(/留言 \((\d+)\)/);
+        if(m){
+            const n = count != null ? count : parseInt(m[1]) + 1;
+            toggle.textContent = `💬 留言 (${n})`;
+        }
+    }
+}
+
+// The feed carries only the latest few comments per post; older ones load a page at a time
+document.addEventListener('click', function(e){
+    const btn = e.target.closest('.load-older-comments');
+    if(!btn) return;
+    btn.disabled = true;
+    fetch('/post/' + btn.dataset.postId + '/comments?cursor=' + encodeURIComponent(btn.dataset.cursor)).then(r=>r.json()).then(j=>{
+        if(!j.ok) throw new Error('load');
+        const list = btn.parentElement.querySelector('.comment-list');
+        // pages come newest first; prepend each so the list stays oldest first
+        j.comments.forEach(c => list.insertBefore(commentNode(c), list.firstChild));
+        if(j.next_cursor){ btn.dataset.cursor = j.next_cursor; btn.disabled = false; }
+        else { btn.remove(); }
+    }).catch(()=>{ btn.disabled = false; alert('載入失敗'); })
+});
+
 // Handle comment form submit
 document.addEventListener('submit', function(e){
     if(e.target.matches('.comment-form')){
         e.preventDefault();
         const formEl = e.target;
         const postId = formEl.dataset.postId;
-        const fd = new FormData(formEl);
-        fd.append('post_id', postId);
+        const textInput = formEl.querySelector('input[name="text"]');
         const submitBtn = formEl.querySelector('button[type="submit"]');
         if(submitBtn) submitBtn.disabled = true;
-        fetch('/comment', {method: 'POST', body: fd})
-            .then(r => r.json())
+        queueOp({op: 'comment', post_id: Number(postId), text: textInput ? textInput.value : ''})
             .then(data => {
                 if(data.ok){
-                    const list = formEl.parentElement.querySelector('.comment-list');
-                    const li = document.createElement('li');
-                    const avatar = data.comment.avatar ? `<img src="${data.comment.avatar}" class="avatar" style="width:28px;height:28px;object-fit:cover;border-radius:50%;margin-right:8px;">` : `<div class="avatar placeholder" style="width:28px;height:28px;margin-right:8px;display:inline-flex;align-items:center;justify-content:center;">${data.comment.user[0].toUpperCase()}</div>`;
-                    li.innerHTML = `${avatar}<strong>${data.comment.user}</strong>: ${data.comment.text} <span class="c-time">${data.comment.time}</span>`;
-                    list.appendChild(li);
+                    appendComment(postId, data.comment, data.comment_count);
                     // clear input
-                    const textInput = formEl.querySelector('input[name="text"]');
                     if(textInput) textInput.value = '';
-                    // update comment count in toggle button
-                    const toggle = document.querySelector('.comment-toggle[data-post-id="'+postId+'"]');
-                    if(toggle){
-                        const m = toggle.textContent.match(/留言 \((\d+)\)/);
-                        if(m){
-                            const n = parseInt(m[1]) + 1;
-                            toggle.textContent = `💬 留言 (${n})`;
-                        }
-                    }
                 } else {
                     alert(data.error || '留言失敗');
                 }
@@ -137,3 +205,66 @@ document.addEventListener('click', function(e){
     }
 });
 
+
+// Home feed "load more" (keyset cursor from /feed)
+document.addEventListener('click', function(e){
+    const more = e.target.closest('#load-more');
+    if(!more) return;
+    const cursor = more.dataset.cursor;
+    if(!cursor) return;
+    more.disabled = true;
+    fetch('/feed?format=html&cursor=' + encodeURIComponent(cursor))
+        .then(r => {
+            if(r.status !== 200) throw new Error('Network');
+            const next = r.headers.get('X-Next-Cursor');
+            return r.text().then(html => ({html, next}));
+        })
+        .then(({html, next}) => {
+            const list = document.getElementById('feed-posts');
+            if(list) list.insertAdjacentHTML('beforeend', html);
+            liveConnect();
+            if(next){
+                more.dataset.cursor = next;
+                more.disabled = false;
+            } else {
+                more.parentElement.remove();
+            }
+        }).catch(()=> { more.disabled = false; alert('載入失敗'); });
+});
+
+
+// Live updates (Server-Sent Events from /events): like counts and new comments for the posts on
+// screen, plus the unread notification count. Reconnects with the new post list after "load more".
+let liveSource = null;
+let liveLastId = null;
+
+function setUnread(n){
+    const count = document.getElementById('unread-count');
+    const badge = document.getElementById('unread-badge');
+    if(count) count.textContent = n;
+    if(badge) badge.hidden = !(n > 0);
+}
+
+function liveConnect(){
+    const feed = document.querySelector('[data-live]');
+    if(!feed || !window.EventSource) return;
+    const ids = Array.from(feed.querySelectorAll('article.post[data-post-id]')).map(a => a.dataset.postId);
+    if(liveSource){
+        liveLastId = liveSource.lastEventId || liveLastId;
+        liveSource.close();
+    }
+    let url = '/events?posts=' + encodeURIComponent(ids.join(','));
+    if(liveLastId) url += '&last_id=' + encodeURIComponent(liveLastId);
+    liveSource = new EventSource(url);
+    liveSource.addEventListener('likes', e => {
+        const d = JSON.parse(e.data);
+        document.querySelectorAll('.like-btn[data-post-id="'+d.post_id+'"] .like-count').forEach(el => el.textContent = d.likes);
+    });
+    liveSource.addEventListener('comment', e => {
+        const d = JSON.parse(e.data);
+        appendComment(d.post_id, d.comment, d.comment_count);
+    });
+    liveSource.addEventListener('unread', e => setUnread(JSON.parse(e.data).unread));
+}
+
+document.addEventListener('DOMContentLoaded', liveConnect);
@@ -19,17 +19,9 @@ DB_PASSWORD = os.environ.get('DB_PASSWORD', "I2z4d9zpoZN6s3JfRO2C4ymmc7wmzv4T")
 DB_PORT = os.environ.get('DB_PORT', '5432')
 BADGE_FOLDER = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static', 'badges')
 
-BADGE_DEFINITIONS = {
-    'streak_3': {'title': '3 Day Streak', 'desc': 'Complete 3 consecutive check-ins', 'slug': 'streak_3', 'image_files': ['3 day.png']},
-    'streak_7': {'title': '7 Day Streak', 'desc': 'Complete 7 consecutive check-ins', 'slug': 'streak_7', 'image_files': ['7 day.png']},
-    'hours_50': {'title': '50 Hours', 'desc': 'Accumulate 50 hours of activity', 'slug': 'hours_50', 'image_files': ['50 hour.png']},
-    'hours_100': {'title': '100 Hours', 'desc': 'Accumulate 100 hours of activity', 'slug': 'hours_100', 'image_files': ['100hour.png']},
-    'hours_500': {'title': '500 Hours', 'desc': 'Accumulate 500 hours of activity', 'slug': 'hours_500', 'image_files': ['500 hour.png']},
-    'comments_5': {'title': '5 Comments', 'desc': 'Receive 5 comments on your posts', 'slug': 'comments_5', 'image_files': ['5com.png']},
-    'likes_10': {'title': '10 Likes', 'desc': 'Receive 10 likes on your posts', 'slug': 'likes_10', 'image_files': ['10good.png']},
-    'friends_3': {'title': '3 Friends', 'desc': 'Have 3 friends', 'slug': 'friends_3', 'image_files': ['3friend.png']},
-    'friends_10': {'title': '10 Friends', 'desc': 'Have 10 friends', 'slug': 'friends_10', 'image_files': ['10friend.png']},
-}
+# single source of truth for the built-in badges (and their criteria), shared with app.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from badge_definitions import BADGE_DEFINITIONS, criteria_json  # noqa: E402
 
 DSN = {
     'host': DB_HOST,
@@ -82,6 +74,8 @@ def main():
             r = cur.fetchone()
             if r:
                 print('Badge exists:', info['slug'])
+                # older seeds stored no rule; fill it in without touching admin-edited criteria
+                cur.execute('UPDATE badge SET criteria_json = %s WHERE id = %s AND criteria_json IS NULL', (criteria_json(slug), r[0]))
                 continue
             # find image file
             img = None
@@ -91,8 +85,8 @@ def main():
                     img = fname
                     break
             print('Inserting badge:', info['slug'], 'image=', img)
-            cur.execute('INSERT INTO badge (title, "desc", slug, image_filename, is_active) VALUES (%s, %s, %s, %s, %s) RETURNING id',
-                        (info['title'], info['desc'], info['slug'], img, True))
+            cur.execute('INSERT INTO badge (title, "desc", slug, image_filename, criteria_json, is_active) VALUES (%s, %s, %s, %s, %s, %s) RETURNING id',
+                        (info['title'], info['desc'], info['slug'], img, criteria_json(slug), True))
             bid = cur.fetchone()[0]
             print('Inserted badge id', bid)
         conn.commit()